@@ -8,9 +8,68 @@
 import os
 import json
 import logging
-import threading
-from typing import Optional, Dict, Any, List, Callable, Generator
-from openai import OpenAI, AsyncOpenAI
+from functools import lru_cache
+from types import MappingProxyType
+from urllib.parse import urlsplit
+from typing import Optional, Dict, Any, List, Callable, Generator, Union, Mapping
+import orjson
+
+try:
+    # SIMD-реализация base64 (AVX2/SSSE3), в разы быстрее стандартной
+    from pybase64 import b64encode
+except ImportError:
+    from base64 import b64encode
+
+
+# Дополнительные HTTP-заголовки по хосту API (для OpenRouter)
+_EXTRA_HEADERS_BY_HOST = {
+    "openrouter.ai": MappingProxyType({
+        "HTTP-Referer": "https://github.com/user/fast-ask",  # URL проекта
+        "X-Title": "FastAsk"  # Название приложения
+    }),
+}
+_NO_EXTRA_HEADERS = MappingProxyType({})
+
+
+@lru_cache(maxsize=None)
+def _extra_headers_for(api_url: str) -> Mapping[str, str]:
+    """Получение дополнительных заголовков для URL API (результат кэшируется)"""
+    host = urlsplit(api_url).hostname or ""
+    return next(
+        (headers for known_host, headers in _EXTRA_HEADERS_BY_HOST.items() if known_host in host),
+        _NO_EXTRA_HEADERS
+    )
+
+# Общий HTTP-клиент для SDK и потоковых запросов (создается при первом использовании)
+_http_client = None
+
+
+def _get_http_client() -> "httpx.AsyncClient":
+    """Получение общего httpx-клиента
+    
+    HTTP/2 и долгий keepalive позволяют повторным запросам, отправленным
+    через несколько минут, переиспользовать уже установленную TLS-сессию.
+    """
+    global _http_client
+    if _http_client is None:
+        import httpx
+        
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300.0),
+            timeout=httpx.Timeout(None, connect=5)
+        )
+    return _http_client
+
+
+def _sniff_image_mime(data) -> str:
+    """Определение MIME-типа изображения по сигнатуре (по умолчанию PNG)"""
+    head = bytes(data[:12])
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
 
 
 class OpenAIClient:
@@ -28,28 +87,21 @@ class OpenAIClient:
         self.api_url = api_url or os.getenv("OPENAI_API_URL", "https://api.openai.com")
         self.model = model or os.getenv("OPENAI_MODEL", "google/gemini-2.5-flash")
         
-        # Флаг для прерывания генерации
-        self.cancel_generation = threading.Event()
+        # Флаг для прерывания генерации: простой bool проверяется на каждом чанке
+        self._cancelled = False
         
-        # Определяем дополнительные HTTP-заголовки для OpenRouter
-        extra_headers = {}
-        if "openrouter.ai" in self.api_url:
-            extra_headers = {
-                "HTTP-Referer": "https://github.com/user/fast-ask",  # URL проекта
-                "X-Title": "FastAsk"  # Название приложения
-            }
+        # Определяем дополнительные HTTP-заголовки (общие неизменяемые словари)
+        self.extra_headers = extra_headers = _extra_headers_for(self.api_url)
         
-        # Инициализация клиентов
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.api_url,
-            default_headers=extra_headers
-        )
+        # SDK (вместе с pydantic и httpx) импортируем только при создании клиента
+        from openai import AsyncOpenAI
         
+        # Инициализация клиента (синхронный не нужен: все запросы идут через asyncio)
         self.async_client = AsyncOpenAI(
             api_key=self.api_key,
             base_url=self.api_url,
-            default_headers=extra_headers
+            default_headers=extra_headers,
+            http_client=_get_http_client()
         )
         
         # Проверяем наличие API ключа
@@ -58,94 +110,6 @@ class OpenAIClient:
         
         logging.info(f"API клиент инициализирован. Модель: {self.model}, URL: {self.api_url}")
     
-    def create_chat_completion(
-        self, 
-        messages: List[Dict[str, str]], 
-        temperature: float = 0.7,
-        max_tokens: int = 1000,
-        stream: bool = False,
-        on_chunk: Optional[Callable[[str], None]] = None,
-        on_finish: Optional[Callable[[], None]] = None
-    ) -> str:
-        """Синхронный запрос к chat/completions API
-        
-        Args:
-            messages: Список сообщений в формате OpenAI
-            temperature: Температура генерации (0.0 - 1.0)
-            max_tokens: Максимальное количество токенов в ответе
-            stream: Использовать потоковую генерацию
-            on_chunk: Коллбэк для обработки частей ответа при потоковой генерации
-            on_finish: Коллбэк, вызываемый при завершении генерации
-            
-        Returns:
-            str: Сгенерированный ответ
-        """
-        # Сбрасываем флаг отмены
-        self.cancel_generation.clear()
-        
-        try:
-            if stream:
-                full_response = ""
-                
-                # Потоковая генерация
-                response_stream = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    stream=True
-                )
-                
-                # Обрабатываем поток ответов
-                for chunk in response_stream:
-                    # Проверяем, не была ли отменена генерация
-                    if self.cancel_generation.is_set():
-                        logging.info("Генерация ответа была прервана пользователем")
-                        response_stream.close()
-                        break
-                    
-                    # Проверяем, есть ли признак завершения
-                    if hasattr(chunk.choices[0], "finish_reason") and chunk.choices[0].finish_reason is not None:
-                        logging.info(f"Генерация завершена, причина: {chunk.choices[0].finish_reason}")
-                        # Вызываем колбэк завершения
-                        if on_finish:
-                            on_finish()
-                        break
-                    
-                    # Извлекаем текст из чанка если он есть
-                    if hasattr(chunk.choices[0].delta, "content") and chunk.choices[0].delta.content is not None:
-                        content = chunk.choices[0].delta.content
-                        full_response += content
-                        
-                        # Вызываем коллбэк с текстом чанка
-                        if on_chunk:
-                            on_chunk(content)
-                
-                # Если мы вышли из цикла без явного вызова on_finish, вызываем его сейчас
-                if on_finish and not self.cancel_generation.is_set():
-                    on_finish()
-                
-                return full_response
-            else:
-                # Обычная генерация
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-                
-                return response.choices[0].message.content
-                
-        except Exception as e:
-            error_message = f"Ошибка: Не удалось получить ответ от OpenAI API. {str(e)}"
-            logging.error(error_message)
-            
-            if on_chunk and stream:
-                on_chunk(error_message)
-                
-            return error_message
-    
     async def create_chat_completion_async(
         self, 
         messages: List[Dict[str, str]], 
@@ -166,51 +130,24 @@ class OpenAIClient:
             on_finish: Коллбэк, вызываемый при завершении генерации
             
         Returns:
-            str: Сгенерированный ответ
+            str: Сгенерированный ответ (при потоковой генерации с on_chunk -
+                 пустая строка, текст получает on_chunk)
         """
         # Сбрасываем флаг отмены
-        self.cancel_generation.clear()
+        self._cancelled = False
         
         try:
             if stream:
-                full_response = ""
-                
-                # Потоковая генерация
-                response_stream = await self.async_client.chat.completions.create(
-                    model=self.model,
+                # Потоковая генерация напрямую через httpx, минуя обертки SDK
+                full_response = await self._stream_chat_completion_async(
                     messages=messages,
                     temperature=temperature,
                     max_tokens=max_tokens,
-                    stream=True
+                    on_chunk=on_chunk
                 )
                 
-                # Обрабатываем поток ответов
-                async for chunk in response_stream:
-                    # Проверяем, не была ли отменена генерация
-                    if self.cancel_generation.is_set():
-                        logging.info("Генерация ответа была прервана пользователем")
-                        await response_stream.aclose()
-                        break
-                    
-                    # Извлекаем текст из чанка если он есть
-                    if hasattr(chunk.choices[0].delta, "content") and chunk.choices[0].delta.content is not None:
-                        content = chunk.choices[0].delta.content
-                        full_response += content
-                        
-                        # Вызываем коллбэк с текстом чанка
-                        if on_chunk:
-                            on_chunk(content)
-
-                    # Проверяем, есть ли признак завершения
-                    if hasattr(chunk.choices[0], "finish_reason") and chunk.choices[0].finish_reason is not None:
-                        logging.info(f"Генерация завершена, причина: {chunk.choices[0].finish_reason}")
-                        # Вызываем колбэк завершения
-                        if on_finish:
-                            on_finish()
-                        break
-                
-                # Если мы вышли из цикла без явного вызова on_finish, вызываем его сейчас
-                if on_finish and not self.cancel_generation.is_set():
+                # Вызываем колбэк завершения, если генерация не была прервана
+                if on_finish and not self._cancelled:
                     on_finish()
                     
                 return full_response
@@ -236,49 +173,45 @@ class OpenAIClient:
     
     def cancel(self):
         """Отмена текущей генерации ответа"""
-        self.cancel_generation.set()
+        self._cancelled = True
         logging.info("Запрошена отмена генерации ответа")
     
-    def create_system_message(self, content: str) -> Dict[str, str]:
-        """Создание системного сообщения"""
-        return {"role": "system", "content": content}
-    
-    def create_user_message(self, content: str) -> Dict[str, str]:
-        """Создание пользовательского сообщения"""
-        return {"role": "user", "content": content}
-    
-    def create_assistant_message(self, content: str) -> Dict[str, str]:
-        """Создание сообщения ассистента"""
-        return {"role": "assistant", "content": content}
-    
-    def create_image_message(self, text_content: str, image_path: str) -> List[Dict[str, Any]]:
+    def create_image_message(self, text_content: str, image: Union[bytes, str]) -> List[Dict[str, Any]]:
         """Создание сообщения с изображением для vision-модели
         
         Args:
             text_content (str): Текстовая часть сообщения
-            image_path (str): Путь к изображению
+            image (bytes or str): Изображение в памяти (PNG/JPEG/WebP) или путь к нему
             
         Returns:
             List[Dict[str, Any]]: Сообщение в формате для vision-модели
         """
-        from src.utils.screenshot import ScreenshotManager
-        
-        # Получаем base64 для изображения
-        image_base64 = ScreenshotManager.get_base64_image(image_path)
-        if not image_base64:
+        # Файл отображаем в память: base64 кодируется прямо из кэша страниц ОС
+        if not isinstance(image, (bytes, bytearray, memoryview)):
+            from src.utils.screenshot import ScreenshotManager
+            image = ScreenshotManager.get_raw_bytes(image)
+        if not image:
             return [{"type": "text", "text": text_content}]
         
+        # Получаем base64 и MIME-тип изображения
+        mime_type = _sniff_image_mime(image)
+        image_base64 = b64encode(image)
+        
+        # Собираем data URL в одном буфере, без промежуточной строки base64
+        url_buffer = bytearray(f"data:{mime_type};base64,".encode("ascii"))
+        url_buffer += image_base64
+        
         # Формируем сообщение с изображением
         return [
             {"type": "text", "text": text_content},
             {
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/png;base64,{image_base64}"
+                    "url": url_buffer.decode("ascii")
                 }
             }
         ]
-
+    
     async def _stream_chat_completion_async(
         self, 
         messages: List[Dict[str, str]], 
@@ -295,10 +228,11 @@ class OpenAIClient:
             on_chunk: Коллбэк для обработки частей ответа
             
         Returns:
-            str: Сгенерированный ответ целиком
+            str: Сгенерированный ответ целиком или пустая строка, если задан
+                 on_chunk (тогда ответ накапливает сам получатель частей)
         """
         # Формируем URL
-        url = f"{self.api_url}/chat/completions"
+        url = f"{self.api_url.rstrip('/')}/chat/completions"
         
         # Формируем данные запроса
         data = {
@@ -309,4 +243,58 @@ class OpenAIClient:
             "stream": True,
         }
         
-        full_response = "" 
\ No newline at end of file
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+            **self.extra_headers
+        }
+        
+        # Текст отдаем либо в on_chunk, либо копим сами, но не дублируем
+        parts: List[str] = []
+        sink = on_chunk or parts.append
+        loads = orjson.loads
+        
+        # orjson сразу отдает bytes: для запросов со скриншотом тело занимает мегабайты
+        body = orjson.dumps(data)
+        
+        async with _get_http_client().stream("POST", url, content=body, headers=headers) as response:
+            if response.status_code >= 400:
+                error_body = await response.aread()
+                raise RuntimeError(f"HTTP {response.status_code}: {error_body.decode('utf-8', 'replace')}")
+            
+            # Разбираем SSE построчно
+            async for line in response.aiter_lines():
+                # Проверяем, не была ли отменена генерация
+                if self._cancelled:
+                    logging.info("Генерация ответа была прервана пользователем")
+                    break
+                
+                # Пропускаем пустые строки и комментарии (": ping", ": OPENROUTER PROCESSING")
+                if not line or line[0] == ":" or not line.startswith("data:"):
+                    continue
+                
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                
+                obj = loads(payload)
+                if "error" in obj:
+                    raise RuntimeError(obj["error"].get("message", str(obj["error"])))
+                
+                choices = obj.get("choices")
+                if not choices:
+                    continue
+                
+                choice = choices[0]
+                content = (choice.get("delta") or {}).get("content")
+                if content:
+                    sink(content)
+                
+                # Проверяем, есть ли признак завершения
+                finish_reason = choice.get("finish_reason")
+                if finish_reason is not None:
+                    logging.info(f"Генерация завершена, причина: {finish_reason}")
+                    break
+        
+        return "".join(parts)
@@ -5,25 +5,28 @@
 Основной класс приложения FastAsk
 """
 
-import os
 import sys
 import logging
+import time
 import asyncio
 import threading
-from pathlib import Path
+from collections import deque
 from functools import partial
 from PyQt6.QtWidgets import QApplication
-from PyQt6.QtCore import Qt, QSettings, pyqtSlot, QThread, QObject, pyqtSignal
+from PyQt6.QtCore import Qt, QSettings, pyqtSlot, QObject, pyqtSignal
 
-from src.ui.main_window import MainWindow
-from src.ui.modern_window import ModernWindow
 from src.models.db_manager import DatabaseManager
 from src.utils.hotkey_manager import HotkeyManager
-from src.utils.screenshot import ScreenshotManager
 from src.api.openai_client import OpenAIClient
+from src.utils.config import AppConfig
 
 class APIWorker(QObject):
-    """Рабочий поток для работы с API в фоне"""
+    """Обработчик запроса к API, выполняемый в цикле asyncio
+    
+    Объект живет в UI-потоке, а его корутина run() выполняется в фоновом
+    цикле asyncio. Сигналы, испускаемые из фонового потока, доставляются
+    в UI-поток через очередь событий Qt.
+    """
     
     # Сигнал о получении ответа
     response_received = pyqtSignal(str)
@@ -37,8 +40,11 @@ class APIWorker(QObject):
     # Сигнал об окончании генерации (с полным ответом)
     generation_complete = pyqtSignal(str)
     
+    # Минимальный интервал между сигналами response_chunk (в секундах)
+    CHUNK_FLUSH_INTERVAL = 0.016
+    
     def __init__(self, client, messages, temperature, max_tokens, stream=True):
-        """Инициализация рабочего потока
+        """Инициализация обработчика запроса
         
         Args:
             client: Экземпляр OpenAIClient
@@ -53,42 +59,82 @@ class APIWorker(QObject):
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.stream = stream
-        self.full_response = ""  # Для накопления полного ответа
+        self._parts = []  # Части ответа, склеиваются один раз в on_finish
+        self._pending = deque()  # Части, еще не отправленные в UI
+        self._last_flush = 0.0
+        self._flush_handle = None  # Отложенная отправка частей в цикле asyncio
     
-    def run(self):
-        """Запуск обработки запроса"""
-        response = self.client.create_chat_completion(
-            messages=self.messages,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            stream=self.stream,
-            on_chunk=self.on_chunk if self.stream else None,
-            on_finish=self.on_finish if self.stream else None
-        )
-        
-        if not self.stream:
-            # Если не потоковая генерация, эмитим весь ответ сразу
-            self.response_received.emit(response)
-        
-        self.finished.emit()
+    async def run(self):
+        """Обработка запроса (выполняется в цикле asyncio)"""
+        try:
+            response = await self.client.create_chat_completion_async(
+                messages=self.messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stream=self.stream,
+                on_chunk=self.on_chunk if self.stream else None,
+                on_finish=self.on_finish if self.stream else None
+            )
+            
+            if not self.stream:
+                # Если не потоковая генерация, эмитим весь ответ сразу
+                self.response_received.emit(response)
+            
+            # Отправляем остаток буфера (например, после ошибки)
+            self._flush_pending()
+        finally:
+            # После отмены задачи отложенная отправка не должна сработать:
+            # ее текст попал бы в ответ на следующий запрос
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            self._pending.clear()
+            self.finished.emit()
     
     def on_chunk(self, chunk):
         """Обработка получения части ответа"""
-        self.full_response += chunk
-        self.response_chunk.emit(chunk)
+        self._parts.append(chunk)
+        self._pending.append(chunk)
+        
+        # Объединяем части, пришедшие чаще CHUNK_FLUSH_INTERVAL, в один сигнал
+        now = time.monotonic()
+        delay = self._last_flush + self.CHUNK_FLUSH_INTERVAL - now
+        if delay <= 0:
+            self._flush_pending(now)
+        elif self._flush_handle is None:
+            # Придержанные части уйдут по таймеру, даже если сервер замолчит
+            self._flush_handle = asyncio.get_running_loop().call_later(delay, self._flush_pending)
+    
+    def _flush_pending(self, now=None):
+        """Отправка накопленных частей ответа одним сигналом"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        if self._pending:
+            text = "".join(self._pending)
+            self._pending.clear()
+            self.response_chunk.emit(text)
+        self._last_flush = now if now is not None else time.monotonic()
     
     def on_finish(self):
         """Обработка завершения генерации"""
-        # Эмитим сигнал с полным ответом
-        self.generation_complete.emit(self.full_response)
+        # Досылаем буфер до сигнала о завершении
+        self._flush_pending()
+        
+        # Собираем полный ответ одним join и эмитим сигнал
+        self.generation_complete.emit("".join(self._parts))
 
 class Application(QApplication):
     """Основной класс приложения FastAsk"""
-
+    
     def __init__(self, argv):
         """Инициализация приложения"""
         super().__init__(argv)
         
+        # Конфигурация читается из окружения один раз при запуске
+        self.cfg = AppConfig.from_env()
+        
         # Настройка логгирования
         self._setup_logging()
         
@@ -100,16 +146,15 @@ class Application(QApplication):
         self._setup_ui()
         self._setup_hotkeys()
         
-        # Текущий рабочий поток для API запросов
+        # Текущий обработчик запроса и его future в цикле asyncio
         self.api_worker = None
-        self.api_thread = None
+        self.api_future = None
         
         logging.info("Приложение FastAsk инициализировано")
     
     def _setup_logging(self):
         """Настройка логгирования"""
-        log_level = os.getenv("LOG_LEVEL", "INFO")
-        numeric_level = getattr(logging, log_level.upper(), None)
+        numeric_level = getattr(logging, self.cfg.log_level.upper(), None)
         if not isinstance(numeric_level, int):
             numeric_level = logging.INFO
         
@@ -123,39 +168,66 @@ class Application(QApplication):
     
     def _setup_settings(self):
         """Инициализация настроек приложения"""
+        # QSettings нужен только для сохраняемых пользовательских настроек
         self.settings = QSettings("FastAsk", "FastAsk")
         
+        # Системное сообщение общее для всех запросов (SDK не изменяет элементы списка)
+        self._system_msg = {"role": "system", "content": self.cfg.system_prompt}
+        
         # Установка темы приложения
-        theme = os.getenv("THEME", "dark")
-        self.set_theme(theme)
+        self.set_theme(self.cfg.theme)
     
     def _setup_database(self):
         """Инициализация базы данных"""
-        db_path = os.getenv("DB_PATH", "data/history.db")
-        # Создаем папку, если не существует
-        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db_manager = DatabaseManager(self.cfg.db_path)
         
-        self.db_manager = DatabaseManager(db_path)
+        # Дописываем очередь записи в БД перед выходом
+        self.aboutToQuit.connect(self.db_manager.close)
     
     def _setup_api_client(self):
         """Инициализация клиента API"""
-        self.api_client = OpenAIClient()
+        # Используем одну и ту же модель для всех запросов (Gemini 2.5 Flash мультимодальная)
+        self.api_client = OpenAIClient(
+            api_key=self.cfg.api_key,
+            api_url=self.cfg.api_url,
+            model=self.cfg.model
+        )
+        
+        # Один постоянный цикл asyncio в фоновом потоке для всех запросов
+        self.api_loop = asyncio.new_event_loop()
+        self.api_loop_thread = threading.Thread(
+            target=self.api_loop.run_forever,
+            name="FastAskApiLoop",
+            daemon=True
+        )
+        self.api_loop_thread.start()
+        
+        self.aboutToQuit.connect(self._shutdown_api_loop)
+    
+    def _shutdown_api_loop(self):
+        """Остановка цикла asyncio при выходе из приложения"""
+        if self.api_future and not self.api_future.done():
+            self.api_future.cancel()
+        self.api_loop.call_soon_threadsafe(self.api_loop.stop)
     
     def _setup_screenshot_manager(self):
         """Инициализация менеджера скриншотов"""
-        screenshots_dir = os.getenv("SCREENSHOTS_DIR", "data/screenshots")
-        Path(screenshots_dir).mkdir(parents=True, exist_ok=True)
+        from src.utils.screenshot import ScreenshotManager
         
-        self.screenshot_manager = ScreenshotManager(screenshots_dir)
+        self.screenshot_manager = ScreenshotManager(
+            self.cfg.screenshots_dir,
+            save_to_disk=self.cfg.save_screenshots,
+            quantize=self.cfg.quantize_screenshots
+        )
     
     def _setup_ui(self):
         """Инициализация пользовательского интерфейса"""
-        # Используем современный интерфейс
-        use_modern_ui = os.getenv("USE_MODERN_UI", "true").lower() == "true"
-        
-        if use_modern_ui:
+        # Импортируем только модуль выбранного окна
+        if self.cfg.use_modern_ui:
+            from src.ui.modern_window import ModernWindow
             self.main_window = ModernWindow(self)
         else:
+            from src.ui.main_window import MainWindow
             self.main_window = MainWindow(self)
         
         # Подключаем сигналы
@@ -175,16 +247,13 @@ class Application(QApplication):
         self.hotkey_manager = HotkeyManager()
         
         # Регистрируем хоткеи
-        app_hotkey = os.getenv("APP_HOTKEY", "ctrl+shift+space")
-        screenshot_hotkey = os.getenv("SCREENSHOT_HOTKEY", "ctrl+shift+s")
-        
         self.hotkey_manager.register_hotkey(
-            app_hotkey, 
+            self.cfg.app_hotkey, 
             self.main_window.show_hide
         )
         
         self.hotkey_manager.register_hotkey(
-            screenshot_hotkey,
+            self.cfg.screenshot_hotkey,
             self.screenshot_manager.capture
         )
     
@@ -194,44 +263,52 @@ class Application(QApplication):
         
         Args:
             query (str): Текст запроса
-            screenshot (Path, optional): Путь к скриншоту
+            screenshot (CapturedScreenshot, optional): Скриншот (PNG или JPEG в памяти и путь к файлу)
         """
         # Если уже идет генерация, ничего не делаем
-        if self.api_thread and self.api_thread.isRunning():
+        if self.api_future and not self.api_future.done():
             return
         
-        # Получаем параметры генерации из настроек
-        temperature = float(os.getenv("TEMPERATURE", "0.7"))
-        max_tokens = int(os.getenv("MAX_TOKENS", "1000"))
-        system_prompt = os.getenv("SYSTEM_PROMPT", "Ты полезный ассистент. Отвечай кратко и по делу.")
-        model = os.getenv("OPENAI_MODEL", "google/gemini-2.5-flash")
-        
-        # Используем одну и ту же модель для всех запросов (Gemini 2.5 Flash мультимодальная)
-        self.api_client.model = model
-        
-        # Создаем сообщения для отправки
-        messages = []
-        
-        # Добавляем системное сообщение
-        messages.append(self.api_client.create_system_message(system_prompt))
+        # Параметры генерации уже прочитаны в конфигурацию
+        temperature = self.cfg.temperature
+        max_tokens = self.cfg.max_tokens
+        model = self.cfg.model
         
         # Если есть скриншот, добавляем его к запросу
         if screenshot:
             # Создаем сообщение с изображением
             user_message = {
                 "role": "user",
-                "content": self.api_client.create_image_message(query, screenshot)
+                "content": self.api_client.create_image_message(query, screenshot.data)
             }
-            messages.append(user_message)
             
             logging.info(f"Отправка запроса с изображением, используя модель: {model}")
         else:
             # Обычный текстовый запрос
-            messages.append(self.api_client.create_user_message(query))
+            user_message = {"role": "user", "content": query}
             
             logging.info(f"Отправка текстового запроса, используя модель: {model}")
         
-        # Создаем рабочий поток
+        # Системное сообщение берем готовым из настроек
+        messages = [self._system_msg, user_message]
+        
+        # Сохраняем запрос в историю (запись идет в фоновом потоке БД)
+        history_id = self.db_manager.add_history_item(
+            query=query,
+            response="[Генерация...]",
+            has_screenshot=bool(screenshot),
+            screenshot_path=screenshot.path if screenshot else None,
+            model_name=self.api_client.model,
+            metadata={
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            }
+        )
+        
+        # Сохраняем ID для последующего обновления
+        self.current_history_id = history_id
+        
+        # Создаем обработчик запроса
         self.api_worker = APIWorker(
             client=self.api_client,
             messages=messages,
@@ -240,74 +317,54 @@ class Application(QApplication):
             stream=True  # Всегда используем потоковую генерацию
         )
         
-        # Создаем и настраиваем поток
-        self.api_thread = QThread()
-        self.api_worker.moveToThread(self.api_thread)
+        # Сигналы, которые срабатывают один раз, подключаем одноразово:
+        # Qt сам отключит их после первого срабатывания
+        single_shot = Qt.ConnectionType.SingleShotConnection
         
-        # Подключаем сигналы
-        self.api_thread.started.connect(self.api_worker.run)
-        self.api_worker.finished.connect(self.api_thread.quit)
-        self.api_worker.finished.connect(self.api_worker.deleteLater)
-        self.api_thread.finished.connect(self.api_thread.deleteLater)
-        self.api_thread.finished.connect(self._reset_api_objects)
+        # Подключаем сигналы завершения
+        self.api_worker.finished.connect(partial(self._reset_api_objects, self.api_worker), type=single_shot)
+        self.api_worker.finished.connect(self.api_worker.deleteLater, type=single_shot)
         
         # Подключаем сигналы к главному окну
-        self.api_worker.response_received.connect(self.main_window.on_response_received)
+        self.api_worker.response_received.connect(self.main_window.on_response_received, type=single_shot)
         self.api_worker.response_chunk.connect(self.main_window.on_response_chunk)
-        self.api_worker.generation_complete.connect(self.main_window.on_generation_complete)
-        
-        # Запускаем поток
-        self.api_thread.start()
+        self.api_worker.generation_complete.connect(self.main_window.on_generation_complete, type=single_shot)
         
-        # Сохраняем запрос в историю
-        history_id = self.db_manager.add_history_item(
-            query=query,
-            response="[Генерация...]",
-            has_screenshot=bool(screenshot),
-            screenshot_path=str(screenshot) if screenshot else None,
-            model_name=self.api_client.model,
-            metadata={
-                "temperature": temperature,
-                "max_tokens": max_tokens
-            }
+        # Полный ответ сохраняем в историю вместо заглушки
+        self.api_worker.generation_complete.connect(
+            partial(self.db_manager.update_history_response, history_id),
+            type=single_shot
         )
         
-        # Сохраняем ID для последующего обновления
-        self.current_history_id = history_id
+        # Запускаем обработку в постоянном цикле asyncio
+        self.api_future = asyncio.run_coroutine_threadsafe(
+            self.api_worker.run(),
+            self.api_loop
+        )
     
-    def _reset_api_objects(self):
-        """Сброс ссылок на API объекты после завершения работы потока"""
+    def _reset_api_objects(self, worker):
+        """Сброс ссылок на API объекты после завершения обработки запроса
+        
+        Args:
+            worker (APIWorker): Обработчик, завершивший работу
+        """
+        # Одним вызовом отключаем все оставшиеся соединения обработчика
+        # (finished и generation_complete уже отключились сами как одноразовые)
+        try:
+            worker.disconnect()
+        except (RuntimeError, TypeError):
+            # Объект уже удален или соединений не осталось
+            pass
+        
+        # Если уже запущен новый запрос, его ссылки не трогаем
+        if worker is not self.api_worker:
+            return
+        
         logging.debug("Очистка ссылок на API объекты")
         
-        # Для безопасности обрабатываем любые исключения, так как объект мог быть уже удален
-        if self.api_worker:
-            try:
-                # Пытаемся отключить сигналы, но обрабатываем все возможные исключения
-                try:
-                    self.api_worker.response_received.disconnect()
-                except Exception:
-                    pass
-                    
-                try:
-                    self.api_worker.response_chunk.disconnect()
-                except Exception:
-                    pass
-                    
-                try:
-                    self.api_worker.generation_complete.disconnect()
-                except Exception:
-                    pass
-                    
-                try:
-                    self.api_worker.finished.disconnect()
-                except Exception:
-                    pass
-            except Exception as e:
-                logging.debug(f"Ошибка при отключении сигналов: {e}")
-            
         # Очищаем ссылки на объекты
         self.api_worker = None
-        self.api_thread = None
+        self.api_future = None
     
     @pyqtSlot()
     def on_stop_generation(self):
@@ -316,14 +373,18 @@ class Application(QApplication):
             # Логируем событие остановки
             logging.info("Остановка генерации пользователем")
             
-            # Отменяем текущую генерацию в клиенте
+            # Отменяем текущую генерацию в клиенте и задачу в цикле asyncio
             self.api_client.cancel()
+            if self.api_future:
+                self.api_future.cancel()
             
             # Обновляем запись в истории с информацией о прерывании
             if hasattr(self, 'current_history_id'):
                 try:
-                    # Получаем текущий ответ из UI
-                    partial_response = self.main_window.current_response if hasattr(self.main_window, 'current_response') else "[Генерация прервана]"
+                    # Получаем текущий ответ из UI (None - не пришло ни одной части)
+                    partial_response = getattr(self.main_window, 'current_response', None)
+                    if partial_response is None:
+                        partial_response = "[Генерация прервана]"
                     
                     # Добавляем метку о прерывании
                     if not partial_response.endswith("*Генерация прервана пользователем*"):
@@ -7,25 +7,84 @@ FastAsk - быстрый запуск запросов к LLM (OpenAI API)
 
 import sys
 import os
+import re
 import signal
 import logging
 from pathlib import Path
-from dotenv import load_dotenv
 
 # Добавляем корень проекта в PYTHONPATH
 root_dir = Path(__file__).parent.parent
 sys.path.append(str(root_dir))
 
+def _parse_env(text):
+    """Разбор простого .env файла (строки KEY=VALUE)
+    
+    Args:
+        text (str): Содержимое файла
+        
+    Returns:
+        dict: Переменные окружения или None, если файл требует python-dotenv
+              (подстановки ${...}, escape-последовательности, многострочные
+              значения или текст после закрывающей кавычки)
+    """
+    if '${' in text or '\\' in text:
+        return None
+    
+    env = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('export '):
+            line = line[7:].lstrip()
+        
+        key, sep, value = line.partition('=')
+        if not sep:
+            continue
+        key = key.strip()
+        value = value.strip()
+        
+        if value[:1] in ('"', "'"):
+            # Значение в кавычках: берем все до закрывающей кавычки
+            quote = value[0]
+            end = value.find(quote, 1)
+            if end == -1:
+                return None
+            rest = value[end + 1:].strip()
+            if rest and not rest.startswith('#'):
+                return None
+            value = value[1:end]
+        else:
+            # Отрезаем комментарий в конце строки
+            value = re.split(r'\s+#', value, maxsplit=1)[0]
+        
+        env[key] = value
+    return env
+
+def load_env_file(env_path):
+    """Загрузка .env файла без импорта python-dotenv в типичном случае
+    
+    Как и python-dotenv, не перезаписывает уже заданные переменные окружения.
+    """
+    env = _parse_env(env_path.read_text(encoding='utf-8-sig'))
+    if env is None:
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path=env_path)
+        return
+    
+    for key, value in env.items():
+        os.environ.setdefault(key, value)
+
 # Загружаем .env файл
 env_path = root_dir / '.env'
 if env_path.exists():
-    load_dotenv(dotenv_path=env_path)
+    load_env_file(env_path)
 else:
     print(f"Файл .env не найден, создаем с дефолтными настройками по пути: {env_path}")
     with open(env_path, 'w', encoding='utf-8') as f:
         with open(root_dir / '.env.example', 'r', encoding='utf-8') as example:
             f.write(example.read())
-    load_dotenv(dotenv_path=env_path)
+    load_env_file(env_path)
 
 from src.app import Application
 
@@ -8,12 +8,226 @@
 import sqlite3
 import logging
 import json
+import queue
+import itertools
+import threading
+import time
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 
+import zstandard
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Ответы длиннее порога хранятся сжатыми zstd в response_blob,
+# а в response остается только начало для списка истории
+RESPONSE_COMPRESS_THRESHOLD = 2048
+RESPONSE_PREVIEW_LENGTH = 200
+
+# Неизменяемые тексты запросов: одинаковая строка SQL попадает в кэш
+# подготовленных выражений sqlite3 и не разбирается повторно
+# timestamp (локальное время без зоны, как в записях прежних версий)
+# вычисляет SQLite из того же ts_ms
+SQL_INSERT = '''
+INSERT INTO history (
+    id, query, response, response_blob, response_compressed,
+    has_screenshot, screenshot_path, ts_ms, model_name, metadata, timestamp
+) VALUES (
+    ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, ?10,
+    strftime('%Y-%m-%dT%H:%M:%f', ?8 / 1000.0, 'unixepoch', 'localtime')
+)
+'''
+
+SQL_UPDATE_RESPONSE = '''
+UPDATE history SET response = ?, response_blob = ?, response_compressed = ?
+WHERE id = ?
+'''
+
+_SQL_PAGE_SELECT = '''
+SELECT h.id, h.query, substr(h.response, 1, 200) AS response_preview,
+       h.has_screenshot, h.screenshot_path, h.ts_ms, h.model_name,
+       h.metadata
+FROM history h
+'''
+_SQL_PAGE_FTS_JOIN = "JOIN history_fts f ON f.rowid = h.id\n"
+# Порядок совпадает с индексом idx_history_ts_ms
+_SQL_PAGE_ORDER = "ORDER BY h.ts_ms DESC, h.id DESC LIMIT ?"
+
+# Курсор страницы - пара (ts_ms, id) последней записи: сравнение в том же
+# порядке, что и сортировка, не теряет записи с одинаковым ts_ms
+_SQL_PAGE_BEFORE = "(h.ts_ms, h.id) < (?, ?)"
+
+SQL_SELECT_PAGE = _SQL_PAGE_SELECT + _SQL_PAGE_ORDER
+SQL_SELECT_PAGE_BEFORE = (
+    _SQL_PAGE_SELECT + "WHERE " + _SQL_PAGE_BEFORE + "\n" + _SQL_PAGE_ORDER
+)
+SQL_SELECT_PAGE_FILTER = (
+    _SQL_PAGE_SELECT + _SQL_PAGE_FTS_JOIN
+    + "WHERE history_fts MATCH ?\n" + _SQL_PAGE_ORDER
+)
+SQL_SELECT_PAGE_FILTER_BEFORE = (
+    _SQL_PAGE_SELECT + _SQL_PAGE_FTS_JOIN
+    + "WHERE history_fts MATCH ? AND " + _SQL_PAGE_BEFORE + "\n" + _SQL_PAGE_ORDER
+)
+# Запасной вариант поиска, если SQLite собран без FTS5
+_SQL_PAGE_LIKE = (
+    "WHERE (h.query LIKE ? OR "
+    "history_response(h.response, h.response_blob, h.response_compressed) LIKE ?)"
+)
+SQL_SELECT_PAGE_LIKE = (
+    _SQL_PAGE_SELECT + _SQL_PAGE_LIKE + "\n" + _SQL_PAGE_ORDER
+)
+SQL_SELECT_PAGE_LIKE_BEFORE = (
+    _SQL_PAGE_SELECT + _SQL_PAGE_LIKE + " AND " + _SQL_PAGE_BEFORE + "\n" + _SQL_PAGE_ORDER
+)
+
+# Колонки полной записи истории в порядке выборки
+_HISTORY_COLUMNS = (
+    "id", "query", "response", "response_blob", "response_compressed",
+    "has_screenshot", "screenshot_path", "timestamp", "model_name",
+    "metadata", "ts_ms"
+)
+
+# Последние записи для списка истории: готовый заголовок (первые 60 символов
+# запроса), без ответа и метаданных, в порядке отображения - от старых к новым
+SQL_SELECT_TITLES = '''
+SELECT id, title, query, ts_ms FROM (
+    SELECT id,
+           CASE WHEN length(query) > 60 THEN substr(query, 1, 60) || '...'
+                ELSE query END AS title,
+           query, ts_ms
+    FROM history
+    ORDER BY ts_ms DESC, id DESC LIMIT ?
+)
+ORDER BY ts_ms, id
+'''
+
+# Поддержка FTS-индекса ведется из Python в транзакции записи: сжатые
+# ответы распаковывает только приложение, поэтому в схеме (триггерах)
+# нет ссылок на функции, которых нет у других соединений
+SQL_FTS_INSERT = "INSERT INTO history_fts(rowid, query, response) VALUES (?, ?, ?)"
+SQL_FTS_DELETE = (
+    "INSERT INTO history_fts(history_fts, rowid, query, response) VALUES ('delete', ?, ?, ?)"
+)
+SQL_FTS_CLEAR = "INSERT INTO history_fts(history_fts) VALUES ('delete-all')"
+SQL_SELECT_FTS_SOURCE = (
+    "SELECT id, query, response, response_blob, response_compressed FROM history"
+)
+SQL_SELECT_FTS_SOURCE_BY_ID = SQL_SELECT_FTS_SOURCE + " WHERE id = ?"
+
+SQL_SELECT_BY_ID = f"SELECT {', '.join(_HISTORY_COLUMNS)} FROM history WHERE id = ?"
+SQL_DELETE_BY_ID = "DELETE FROM history WHERE id = ?"
+SQL_CLEAR = "DELETE FROM history"
+
+def _dump_metadata(metadata):
+    """Сериализация metadata в bytes для хранения в BLOB"""
+    if orjson is not None:
+        return orjson.dumps(metadata, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(metadata).encode("utf-8")
+
+def _load_metadata(raw):
+    """Десериализация metadata (BLOB или TEXT из старых записей)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _pack_response(response):
+    """Подготовка ответа к записи: (response, response_blob, response_compressed)"""
+    if len(response) <= RESPONSE_COMPRESS_THRESHOLD:
+        return response, None, 0
+    
+    blob = zstandard.ZstdCompressor(level=3).compress(response.encode("utf-8"))
+    return response[:RESPONSE_PREVIEW_LENGTH], blob, 1
+
+def _unpack_response(response, response_blob, response_compressed):
+    """Полный текст ответа из колонок записи"""
+    if not response_compressed:
+        return response
+    
+    return zstandard.ZstdDecompressor().decompress(response_blob).decode("utf-8")
+
+def _decode_metadata(raw, history_id):
+    """Декодирование metadata записи; None, если данных нет или они повреждены"""
+    if not raw:
+        return None
+    try:
+        return _load_metadata(raw)
+    except ValueError:
+        logging.error("Ошибка при декодировании JSON для записи: %s", history_id)
+        return None
+
+def _row_to_dict(row):
+    """Полная запись истории в виде словаря с декодированной metadata"""
+    history_dict = dict(zip(_HISTORY_COLUMNS, row))
+    history_dict["response"] = _unpack_response(
+        history_dict["response"],
+        history_dict.pop("response_blob"),
+        history_dict.pop("response_compressed")
+    )
+    history_dict["metadata"] = _decode_metadata(history_dict["metadata"], history_dict["id"])
+    return history_dict
+
+_NOT_DECODED = object()
+
+class HistoryRow:
+    """Запись списка истории
+    
+    Легковесная обертка над строкой запроса страницы: metadata хранится
+    в исходном виде и декодируется из JSON только при обращении.
+    """
+    
+    __slots__ = (
+        "id", "query", "response_preview", "has_screenshot",
+        "screenshot_path", "ts_ms", "model_name", "metadata_raw",
+        "_metadata"
+    )
+    
+    def __init__(self, id, query, response_preview, has_screenshot,
+                 screenshot_path, ts_ms, model_name, metadata_raw):
+        self.id = id
+        self.query = query
+        self.response_preview = response_preview
+        self.has_screenshot = has_screenshot
+        self.screenshot_path = screenshot_path
+        self.ts_ms = ts_ms
+        self.model_name = model_name
+        self.metadata_raw = metadata_raw
+        self._metadata = _NOT_DECODED
+    
+    @property
+    def metadata(self):
+        """Метаданные записи (декодируются при первом обращении)"""
+        if self._metadata is _NOT_DECODED:
+            self._metadata = _decode_metadata(self.metadata_raw, self.id)
+        return self._metadata
+    
+    @property
+    def created_at(self):
+        """Время создания записи (локальное) для отображения"""
+        if self.ts_ms is None:
+            return None
+        return datetime.fromtimestamp(self.ts_ms / 1000)
+    
+    def __repr__(self):
+        return f"HistoryRow(id={self.id!r}, query={self.query!r})"
+
+def _history_row_factory(cursor, row):
+    """row_factory курсора для запросов страницы истории"""
+    return HistoryRow(*row)
+
 class DatabaseManager:
     """Класс для работы с базой данных SQLite"""
     
+    # Интервал периодического PRAGMA optimize, в секундах
+    OPTIMIZE_INTERVAL = 2 * 60 * 60
+    
+    # Интервал фонового checkpoint журнала WAL, в секундах
+    CHECKPOINT_INTERVAL = 5 * 60
+    
     def __init__(self, db_path="data/history.db"):
         """Инициализация соединения с базой данных"""
         self.db_path = db_path
@@ -21,13 +235,42 @@ class DatabaseManager:
         # Создаем директорию для БД, если её нет
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
         
+        # Одно соединение на все время работы; доступ к нему из разных
+        # потоков сериализуется блокировкой
+        self._lock = threading.Lock()
+        self._conn = self._get_connection()
+        
         # Инициализация базы данных
         self._initialize_db()
+        
+        # Идентификаторы новых записей выдаем сами, чтобы не ждать INSERT
+        self._id_counter = itertools.count(self._next_history_id())
+        
+        # Очередь операций записи, которую разбирает фоновый поток; после
+        # close() новые операции не принимаются
+        self._write_queue = queue.Queue()
+        self._queue_lock = threading.Lock()
+        self._closed = False
+        self._writer_thread = threading.Thread(
+            target=self._writer_loop,
+            name="FastAskDbWriter",
+            daemon=True
+        )
+        self._writer_thread.start()
+        
+        # Периодическое обслуживание вне UI-потока: статистика планировщика
+        # запросов и перенос WAL в основной файл
+        self._maintenance_timers = {}
+        self._schedule_maintenance(self.OPTIMIZE_INTERVAL, self._optimize)
+        self._schedule_maintenance(self.CHECKPOINT_INTERVAL, self._checkpoint)
     
     def _initialize_db(self):
         """Инициализация схемы базы данных"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
+        
+        # WAL сохраняется в файле БД, поэтому достаточно включить его один раз
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA journal_size_limit=67108864")  # 64 МБ
         
         # Создаем таблицу для истории запросов
         cursor.execute('''
@@ -39,147 +282,483 @@ class DatabaseManager:
             screenshot_path TEXT,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
             model_name TEXT,
-            metadata TEXT
+            metadata BLOB,
+            ts_ms INTEGER,
+            response_blob BLOB,
+            response_compressed INTEGER DEFAULT 0
         )
         ''')
         
-        # Создаем индекс для ускорения поиска
+        # Время создания в миллисекундах Unix: целочисленное сравнение
+        # и компактный индекс вместо строк ISO
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(history)")}
+        if "ts_ms" not in columns:
+            cursor.execute("ALTER TABLE history ADD COLUMN ts_ms INTEGER")
+            # timestamp в старых записях - локальное время без зоны
+            cursor.execute('''
+            UPDATE history
+            SET ts_ms = CAST((julianday(timestamp, 'utc') - 2440587.5) * 86400000 AS INTEGER)
+            WHERE ts_ms IS NULL
+            ''')
+            logging.info("Добавлена колонка ts_ms в таблицу истории")
+        
+        # Колонки для сжатых ответов
+        if "response_blob" not in columns:
+            cursor.execute("ALTER TABLE history ADD COLUMN response_blob BLOB")
+            cursor.execute(
+                "ALTER TABLE history ADD COLUMN response_compressed INTEGER DEFAULT 0"
+            )
+        
+        # Индекс под сортировку страниц истории без отдельного шага сортировки;
+        # он же заменяет прежние индексы по строковому timestamp
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_ts_ms ON history(ts_ms DESC, id DESC)
+        ''')
+        cursor.execute("DROP INDEX IF EXISTS idx_history_ts_id")
+        cursor.execute("DROP INDEX IF EXISTS idx_history_timestamp")
+        
+        # Частичный индекс только по записям со скриншотом и индекс
+        # для выборок по модели
         cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp)
+        CREATE INDEX IF NOT EXISTS idx_history_with_shot ON history(ts_ms DESC)
+        WHERE has_screenshot = 1
         ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_model ON history(model_name, ts_ms DESC)
+        ''')
+        
+        # Полнотекстовый индекс для поиска по истории
+        self._fts_enabled = self._initialize_fts(cursor)
         
-        conn.commit()
-        conn.close()
+        logging.info("База данных инициализирована: %s", self.db_path)
+    
+    def _initialize_fts(self, cursor):
+        """Создание FTS5-таблицы history_fts
+        
+        Таблица хранит только индекс (external content), сами тексты
+        берутся из history. Индекс обновляется методами записи вместе
+        с history, сжатые ответы индексируются полностью. Возвращает
+        False, если SQLite собран без FTS5.
+        """
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history_fts'"
+        )
+        fts_exists = cursor.fetchone() is not None
+        
+        try:
+            cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                query, response,
+                content='history', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            ''')
+        except sqlite3.OperationalError as e:
+            logging.warning("FTS5 недоступен, поиск будет выполняться через LIKE: %s", e)
+            return False
+        
+        # Триггеры прежних версий вызывали функцию history_response, которая
+        # есть только у соединения приложения: любое другое соединение не могло
+        # изменить history. Теперь индекс ведется из Python
+        for trigger in ("history_fts_ai", "history_fts_ad", "history_fts_au"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        
+        # Индексируем записи, созданные до появления FTS-таблицы ('rebuild'
+        # прочитал бы из history только начало сжатых ответов)
+        if not fts_exists:
+            cursor.execute("BEGIN")
+            rows = self._conn.execute(SQL_SELECT_FTS_SOURCE)
+            cursor.executemany(SQL_FTS_INSERT, (
+                (row[0], row[1], _unpack_response(row[2], row[3], row[4]))
+                for row in rows
+            ))
+            cursor.execute("COMMIT")
+        
+        return True
+    
+    @staticmethod
+    def _fts_match_query(query_filter):
+        """Преобразование пользовательской строки в безопасный запрос FTS5
         
-        logging.info(f"База данных инициализирована: {self.db_path}")
+        Каждое слово берется в кавычки (экранируя служебный синтаксис FTS5)
+        и ищется по префиксу; слова объединяются через AND.
+        """
+        terms = []
+        for term in query_filter.split():
+            terms.append('"' + term.replace('"', '""') + '"*')
+        return " ".join(terms)
     
     def _get_connection(self):
-        """Получение соединения с базой данных"""
-        return sqlite3.connect(self.db_path)
+        """Открытие соединения с базой данных
+        
+        Соединение создается один раз и используется всеми потоками.
+        Транзакциями управляем сами (isolation_level=None), параметры
+        соединения применяются однократно при открытии.
+        """
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None
+        )
+        conn.execute("PRAGMA synchronous=NORMAL")  # В режиме WAL fsync только при checkpoint
+        conn.execute("PRAGMA cache_size=-16000")  # 16 МБ (отрицательное значение - в КБ)
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")  # 256 МБ
+        conn.execute("PRAGMA analysis_limit=1000")  # Ограничиваем работу PRAGMA optimize
+        # Автоматический checkpoint реже (по умолчанию каждые 1000 страниц),
+        # основную работу делает фоновый _checkpoint
+        conn.execute("PRAGMA wal_autocheckpoint=10000")
+        
+        # Полный текст ответа (в том числе сжатого) для поиска через LIKE,
+        # если SQLite собран без FTS5; в схеме БД функция не используется
+        conn.create_function("history_response", 3, _unpack_response, deterministic=True)
+        
+        # Строки с доступом по имени колонки без построения словарей в Python
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def _next_history_id(self):
+        """Следующий свободный ID записи истории (с учетом AUTOINCREMENT)"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute("SELECT MAX(id) FROM history")
+            max_id = cursor.fetchone()[0] or 0
+            
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'history'")
+            row = cursor.fetchone()
+        
+        return max(max_id, row[0] if row else 0) + 1
+    
+    def _writer_loop(self):
+        """Фоновый поток записи: выполняет накопившиеся операции одной транзакцией"""
+        conn = self._conn
+        
+        running = True
+        while running:
+            batch = [self._write_queue.get()]
+            
+            # Забираем все, что успело накопиться в очереди
+            while True:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            operations = [op for op in batch if op is not None]
+            running = len(operations) == len(batch)
+            
+            try:
+                if operations:
+                    with self._lock:
+                        # Каждая операция в своей точке сохранения: ошибка
+                        # одной не откатывает остальные записи пакета
+                        self._run_in_transaction([
+                            partial(self._run_isolated, operation) for operation in operations
+                        ])
+            except Exception as e:
+                logging.error("Ошибка записи в базу данных: %s", e)
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+    
+    def _run_in_transaction(self, operations):
+        """Выполнение операций записи одной транзакцией
+        
+        Каждая операция - функция, принимающая соединение. Вызывается
+        под блокировкой соединения; возвращает результаты операций.
+        """
+        conn = self._conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            results = [operation(conn) for operation in operations]
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return results
+    
+    @staticmethod
+    def _run_isolated(operation, conn):
+        """Выполнение операции записи в точке сохранения (SAVEPOINT)
+        
+        При ошибке откатываются только изменения этой операции.
+        """
+        conn.execute("SAVEPOINT write_operation")
+        try:
+            operation(conn)
+        except Exception as e:
+            conn.execute("ROLLBACK TO write_operation")
+            logging.error("Ошибка записи в базу данных: %s", e)
+        finally:
+            conn.execute("RELEASE write_operation")
+    
+    def _fts_delete(self, conn, history_id):
+        """Удаление записи из FTS-индекса; возвращает ее запрос или None
+        
+        Вызывается до изменения или удаления записи: FTS5 с external content
+        удаляет токены по тем значениям, которые были проиндексированы.
+        """
+        if not self._fts_enabled:
+            return None
+        
+        row = conn.execute(SQL_SELECT_FTS_SOURCE_BY_ID, (history_id,)).fetchone()
+        if row is None:
+            return None
+        
+        conn.execute(SQL_FTS_DELETE, (history_id, row[1], _unpack_response(row[2], row[3], row[4])))
+        return row[1]
+    
+    def _write_insert(self, params, fts_params, conn):
+        """Вставка записей истории вместе с их FTS-индексом"""
+        conn.executemany(SQL_INSERT, params)
+        if self._fts_enabled:
+            conn.executemany(SQL_FTS_INSERT, fts_params)
+    
+    def _write_update_response(self, history_id, response, conn):
+        """Замена ответа в записи истории и в FTS-индексе"""
+        query = self._fts_delete(conn, history_id)
+        conn.execute(SQL_UPDATE_RESPONSE, (*_pack_response(response), history_id))
+        if query is not None:
+            conn.execute(SQL_FTS_INSERT, (history_id, query, response))
+    
+    def _write_delete(self, history_id, conn):
+        """Удаление записи истории и ее FTS-индекса; True, если запись была"""
+        self._fts_delete(conn, history_id)
+        return conn.execute(SQL_DELETE_BY_ID, (history_id,)).rowcount > 0
+    
+    def _write_clear(self, conn):
+        """Удаление всех записей истории и FTS-индекса; возвращает их число"""
+        if self._fts_enabled:
+            conn.execute(SQL_FTS_CLEAR)
+        return conn.execute(SQL_CLEAR).rowcount
+    
+    def _optimize(self):
+        """Обновление статистики планировщика (PRAGMA optimize)
+        
+        Вызывается под блокировкой соединения.
+        """
+        try:
+            self._conn.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            logging.error("Ошибка оптимизации базы данных: %s", e)
+    
+    def _checkpoint(self):
+        """Перенос WAL в основной файл без блокировки читателей и писателей
+        
+        Вызывается под блокировкой соединения.
+        """
+        try:
+            self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        except sqlite3.Error as e:
+            logging.error("Ошибка checkpoint базы данных: %s", e)
+    
+    def _schedule_maintenance(self, interval, task):
+        """Запуск таймера следующего выполнения задачи обслуживания"""
+        timer = threading.Timer(interval, self._on_maintenance_timer, (interval, task))
+        timer.daemon = True
+        self._maintenance_timers[task.__name__] = timer
+        timer.start()
+    
+    def _on_maintenance_timer(self, interval, task):
+        """Периодическое обслуживание БД для долго работающего приложения"""
+        with self._lock:
+            if self._conn is None:
+                return
+            task()
+        
+        self._schedule_maintenance(interval, task)
+    
+    def _enqueue(self, operation):
+        """Постановка операции записи в очередь фонового потока
+        
+        Возвращает False, если база данных уже закрыта и операция отброшена.
+        """
+        with self._queue_lock:
+            if self._closed:
+                logging.warning("База данных закрыта, операция записи отброшена")
+                return False
+            self._write_queue.put(operation)
+        return True
+    
+    def flush(self):
+        """Ожидание записи всех поставленных в очередь операций
+        
+        Блокирует вызывающий поток до окончания записи, поэтому не должен
+        вызываться из UI-потока.
+        """
+        if not self._writer_thread.is_alive():
+            return
+        self._write_queue.join()
+    
+    def close(self):
+        """Запись оставшихся операций и закрытие соединения"""
+        for timer in self._maintenance_timers.values():
+            timer.cancel()
+        
+        with self._queue_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._write_queue.put(None)
+        self._writer_thread.join()
+        
+        with self._lock:
+            if self._conn is None:
+                return
+            
+            # Обновляем статистику планировщика перед закрытием
+            self._optimize()
+            
+            self._conn.close()
+            self._conn = None
     
     def add_history_item(self, query, response, has_screenshot=False, 
                          screenshot_path=None, model_name=None, metadata=None):
-        """Добавление записи в историю запросов"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        """Добавление записи в историю запросов
         
-        # Преобразуем metadata в JSON, если есть
-        metadata_json = json.dumps(metadata) if metadata else None
+        Запись выполняется в фоновом потоке, метод сразу возвращает ID
+        будущей записи (None, если база данных уже закрыта).
+        """
+        history_id, = self.add_history_items([{
+            "query": query,
+            "response": response,
+            "has_screenshot": has_screenshot,
+            "screenshot_path": screenshot_path,
+            "model_name": model_name,
+            "metadata": metadata
+        }])
         
-        cursor.execute('''
-        INSERT INTO history (
-            query, response, has_screenshot, screenshot_path, 
-            timestamp, model_name, metadata
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            query, response, 1 if has_screenshot else 0,
-            screenshot_path, datetime.now().isoformat(),
-            model_name, metadata_json
-        ))
-        
-        history_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        logging.debug(f"Добавлен новый запрос в историю, ID: {history_id}")
+        logging.debug("Добавлен новый запрос в историю, ID: %s", history_id)
         return history_id
     
-    def get_history(self, limit=50, offset=0, query_filter=None):
-        """Получение истории запросов с пагинацией и фильтрацией"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+    def add_history_items(self, rows):
+        """Пакетное добавление записей в историю
         
-        sql = "SELECT * FROM history"
+        rows - последовательность словарей с ключами как у аргументов
+        add_history_item. Все записи вставляются одним executemany в одной
+        транзакции фонового потока. Возвращает список ID будущих записей;
+        после close() записи отбрасываются, а вместо ID возвращается None.
+        """
+        history_ids = []
         params = []
+        fts_params = []
+        # timestamp заполняет сам SQLite из ts_ms; записи с одинаковым
+        # ts_ms упорядочиваются по id
+        ts_ms = int(time.time() * 1000)
         
-        # Добавляем фильтр если есть
-        if query_filter:
-            sql += " WHERE query LIKE ? OR response LIKE ?"
-            params.extend([f"%{query_filter}%", f"%{query_filter}%"])
+        for row in rows:
+            history_id = next(self._id_counter)
+            history_ids.append(history_id)
+            
+            # Преобразуем metadata в JSON, если есть
+            metadata = row.get("metadata")
+            metadata_json = _dump_metadata(metadata) if metadata else None
+            
+            params.append((
+                history_id, row["query"], *_pack_response(row["response"]),
+                1 if row.get("has_screenshot") else 0,
+                row.get("screenshot_path"), ts_ms,
+                row.get("model_name"), metadata_json
+            ))
+            fts_params.append((history_id, row["query"], row["response"]))
         
-        # Сортировка и пагинация
-        sql += " ORDER BY timestamp DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        if params and not self._enqueue(partial(self._write_insert, params, fts_params)):
+            return [None] * len(history_ids)
         
-        cursor.execute(sql, params)
-        history_items = cursor.fetchall()
+        return history_ids
+    
+    def update_history_response(self, history_id, response):
+        """Обновление ответа в записи истории (выполняется в фоновом потоке)"""
+        self._enqueue(partial(self._write_update_response, history_id, response))
         
-        # Получение информации о колонках
-        columns = [description[0] for description in cursor.description]
+        logging.debug("Обновлен ответ в истории, ID: %s", history_id)
+    
+    def get_history(self, limit=50, before_ts_ms=None, query_filter=None, before_id=None):
+        """Получение истории запросов с пагинацией и фильтрацией
         
-        conn.close()
+        Пагинация по ключу: для следующей страницы передаются ts_ms и id
+        последней записи предыдущей страницы в before_ts_ms и before_id.
         
-        # Преобразуем список в словари с ключами-названиями колонок
-        result = []
-        for item in history_items:
-            history_dict = dict(zip(columns, item))
-            
-            # Преобразуем JSON обратно в словарь
-            if history_dict.get("metadata"):
-                try:
-                    history_dict["metadata"] = json.loads(history_dict["metadata"])
-                except json.JSONDecodeError:
-                    logging.error(f"Ошибка при декодировании JSON для записи: {history_dict['id']}")
-            
-            result.append(history_dict)
-            
-        return result
+        Возвращает список HistoryRow. Для списка берется только начало
+        ответа (response_preview); полная запись - через get_history_item.
+        """
+        # Дожидаемся записи, чтобы чтение видело последние изменения
+        self.flush()
+        
+        match_query = self._fts_match_query(query_filter) if query_filter else ""
+        
+        # Без id курсор указывает на начало миллисекунды before_ts_ms
+        if before_ts_ms is not None and before_id is None:
+            before_id = 0
+        
+        # Выбираем один из заранее заданных запросов вместо сборки строки
+        if match_query and self._fts_enabled:
+            if before_ts_ms is None:
+                sql, params = SQL_SELECT_PAGE_FILTER, (match_query, limit)
+            else:
+                sql, params = SQL_SELECT_PAGE_FILTER_BEFORE, (match_query, before_ts_ms, before_id, limit)
+        elif match_query:
+            pattern = f"%{query_filter}%"
+            if before_ts_ms is None:
+                sql, params = SQL_SELECT_PAGE_LIKE, (pattern, pattern, limit)
+            else:
+                sql, params = SQL_SELECT_PAGE_LIKE_BEFORE, (pattern, pattern, before_ts_ms, before_id, limit)
+        elif before_ts_ms is None:
+            sql, params = SQL_SELECT_PAGE, (limit,)
+        else:
+            sql, params = SQL_SELECT_PAGE_BEFORE, (before_ts_ms, before_id, limit)
+        
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.row_factory = _history_row_factory
+            return cursor.execute(sql, params).fetchall()
+    
+    def get_history_titles(self, limit=10):
+        """Последние записи истории для списка: id, title, query и ts_ms
+        
+        Возвращает список sqlite3.Row от старых к новым. Ответ не читается -
+        полная запись загружается через get_history_item.
+        """
+        self.flush()
+        
+        with self._lock:
+            return self._conn.execute(SQL_SELECT_TITLES, (limit,)).fetchall()
     
     def get_history_item(self, history_id):
         """Получение конкретной записи из истории по ID"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        self.flush()
         
-        cursor.execute("SELECT * FROM history WHERE id = ?", (history_id,))
-        item = cursor.fetchone()
+        with self._lock:
+            # Порядок колонок известен заранее, поэтому читаем простые кортежи
+            cursor = self._conn.cursor()
+            cursor.row_factory = None
+            item = cursor.execute(SQL_SELECT_BY_ID, (history_id,)).fetchone()
         
         if not item:
-            conn.close()
             return None
         
-        # Получение информации о колонках
-        columns = [description[0] for description in cursor.description]
-        
-        conn.close()
-        
-        # Преобразуем в словарь
-        history_dict = dict(zip(columns, item))
-        
-        # Преобразуем JSON обратно в словарь
-        if history_dict.get("metadata"):
-            try:
-                history_dict["metadata"] = json.loads(history_dict["metadata"])
-            except json.JSONDecodeError:
-                logging.error(f"Ошибка при декодировании JSON для записи: {history_dict['id']}")
-        
-        return history_dict
+        return _row_to_dict(item)
     
     def delete_history_item(self, history_id):
         """Удаление записи из истории"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM history WHERE id = ?", (history_id,))
-        conn.commit()
+        self.flush()
         
-        deleted = cursor.rowcount > 0
-        conn.close()
+        with self._lock:
+            deleted, = self._run_in_transaction([partial(self._write_delete, history_id)])
         
         if deleted:
-            logging.debug(f"Удалена запись из истории, ID: {history_id}")
+            logging.debug("Удалена запись из истории, ID: %s", history_id)
         
         return deleted
     
     def clear_history(self):
         """Очистка всей истории запросов"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM history")
-        conn.commit()
+        self.flush()
         
-        deleted_count = cursor.rowcount
-        conn.close()
+        with self._lock:
+            deleted_count, = self._run_in_transaction([self._write_clear])
         
-        logging.info(f"История очищена. Удалено записей: {deleted_count}")
+        logging.info("История очищена. Удалено записей: %s", deleted_count)
         return deleted_count 
\ No newline at end of file
@@ -13,11 +13,14 @@ from PyQt6.QtWidgets import (
     QSplitter, QFrame
 )
 from PyQt6.QtCore import Qt, QSize, pyqtSignal, QTimer
-from PyQt6.QtGui import QIcon, QPixmap, QKeySequence, QShortcut
+from PyQt6.QtGui import QIcon, QPixmap, QKeySequence, QShortcut, QTextCursor
 
 class MainWindow(QMainWindow):
     """Основное окно приложения FastAsk"""
     
+    # Интервал вывода накопленных частей ответа, в мс
+    CHUNK_FLUSH_INTERVAL_MS = 30
+    
     # Сигнал для отправки запроса к API
     send_request = pyqtSignal(str, object)
     
@@ -29,6 +32,9 @@ class MainWindow(QMainWindow):
         super().__init__()
         
         self.app = app
+        
+        # Скриншот для следующего запроса (CapturedScreenshot): хранится
+        # уже закодированным (PNG или JPEG) до отправки
         self.screenshot = None
         
         # Настраиваем окно
@@ -43,6 +49,16 @@ class MainWindow(QMainWindow):
         # Состояние генерации ответа
         self.is_generating = False
         
+        # Части ответа копятся в буфере и выводятся по таймеру,
+        # чтобы не перерисовывать поле ответа на каждый фрагмент
+        self._chunk_buffer = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(self.CHUNK_FLUSH_INTERVAL_MS)
+        self._flush_timer.timeout.connect(self._flush_chunks)
+        
+        # Длина текста в поле ответа, чтобы не копировать документ для сравнения
+        self._response_len = 0
+        
         logging.info("Основное окно инициализировано")
     
     def _setup_window(self):
@@ -194,6 +210,9 @@ class MainWindow(QMainWindow):
     
     def _reset_generation_state(self):
         """Сброс состояния генерации"""
+        # Выводим то, что успело прийти до остановки
+        self._flush_chunks()
+        
         self.is_generating = False
         self.progress_bar.setVisible(False)
         self.stop_button.setVisible(False)
@@ -216,19 +235,39 @@ class MainWindow(QMainWindow):
     
     def on_response_received(self, response):
         """Обработка полученного ответа"""
+        self._chunk_buffer.clear()
         self.response_output.setPlainText(response)
+        self._response_len = len(response)
         self._reset_generation_state()
     
     def on_response_chunk(self, chunk):
         """Обработка части ответа (при потоковой генерации)"""
-        current_text = self.response_output.toPlainText()
-        self.response_output.setPlainText(current_text + chunk)
+        self._chunk_buffer.append(chunk)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+    
+    def _flush_chunks(self):
+        """Вывод накопленных частей ответа"""
+        if not self._chunk_buffer:
+            self._flush_timer.stop()
+            return
+        
+        text = "".join(self._chunk_buffer)
+        self._chunk_buffer.clear()
+        
+        # Дописываем в конец документа, не перечитывая и не пересоздавая весь текст
+        self.response_output.moveCursor(QTextCursor.MoveOperation.End)
+        self.response_output.insertPlainText(text)
+        self._response_len += len(text)
     
     def on_generation_complete(self, full_response):
         """Обработка завершения генерации"""
-        # Устанавливаем полный ответ, если нужно
-        if full_response and self.response_output.toPlainText() != full_response:
+        self._flush_chunks()
+        
+        # Устанавливаем полный ответ, если выведенный текст с ним расходится
+        if full_response and self._response_len != len(full_response):
             self.response_output.setPlainText(full_response)
+            self._response_len = len(full_response)
             
         # Скрываем индикаторы генерации
         self._reset_generation_state()
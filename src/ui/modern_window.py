@@ -7,7 +7,6 @@
 
 import os
 import logging
-import markdown
 from enum import Enum
 from datetime import datetime
 from PyQt6.QtWidgets import (
@@ -16,8 +15,104 @@ from PyQt6.QtWidgets import (
     QFrame, QGraphicsDropShadowEffect, QGraphicsOpacityEffect,
     QScrollArea, QApplication
 )
-from PyQt6.QtCore import Qt, QSize, pyqtSignal, QTimer, QPropertyAnimation, QEasingCurve
-from PyQt6.QtGui import QIcon, QColor, QKeySequence, QShortcut, QFontMetrics, QClipboard
+from PyQt6.QtCore import (
+    Qt, QSize, pyqtSignal, QTimer, QPropertyAnimation, QEasingCurve,
+    QObject, QRunnable, QThreadPool
+)
+from PyQt6.QtGui import (
+    QIcon, QColor, QKeySequence, QShortcut, QFontMetrics, QClipboard,
+    QTextCursor, QTextDocument
+)
+
+# Общая таблица стилей окна: задается один раз на фоновом фрейме,
+# виджеты выбираются по objectName
+_APP_STYLE = """
+    QFrame#bgFrame {
+        background-color: rgba(30, 30, 35, 220);
+        border-radius: 15px;
+    }
+    QTextEdit#queryInput {
+        background-color: rgba(45, 45, 50, 150);
+        color: white;
+        border: none;
+        border-radius: 10px;
+        padding: 10px;
+        font-size: 14px;
+    }
+    QTextEdit#responseOutput {
+        background-color: rgba(45, 45, 50, 120);
+        color: white;
+        border: none;
+        border-radius: 10px;
+        padding: 10px;
+        font-size: 14px;
+    }
+    QPushButton#copyBtn {
+        background-color: rgba(60, 60, 65, 150);
+        color: white;
+        border: none;
+        border-radius: 5px;
+        padding: 5px;
+        font-size: 14px;
+        min-width: 30px;
+        max-width: 30px;
+        min-height: 30px;
+        max-height: 30px;
+    }
+    QPushButton#copyBtn:hover {
+        background-color: rgba(80, 80, 85, 200);
+    }
+    QListWidget#historyList {
+        background-color: transparent;
+        color: white;
+        border: none;
+        font-size: 14px;
+    }
+    QListWidget#historyList::item {
+        padding: 8px;
+        margin: 2px 0px;
+        border-radius: 5px;
+    }
+    QListWidget#historyList::item:hover {
+        background-color: rgba(60, 60, 65, 150);
+    }
+    QListWidget#historyList::item:selected {
+        background-color: rgba(70, 130, 180, 150);
+    }
+    QLabel#statusLabel {
+        color: rgba(200, 200, 200, 150);
+        font-size: 11px;
+    }
+    QPushButton#cancelBtn, QPushButton#stopBtn {
+        color: white;
+        border: none;
+        border-radius: 15px;
+        padding: 5px;
+        font-size: 12px;
+        min-width: 30px;
+        max-width: 30px;
+        min-height: 30px;
+        max-height: 30px;
+    }
+    QPushButton#cancelBtn {
+        background-color: rgba(180, 40, 40, 150);
+    }
+    QPushButton#cancelBtn:hover {
+        background-color: rgba(220, 40, 40, 200);
+    }
+    QPushButton#stopBtn {
+        background-color: rgba(40, 120, 180, 150);
+    }
+    QPushButton#stopBtn:hover {
+        background-color: rgba(40, 150, 220, 200);
+    }
+"""
+
+# Диалект Markdown для рендеринга ответов (GitHub: таблицы, блоки кода ```)
+MARKDOWN_DIALECT = QTextDocument.MarkdownFeature.MarkdownDialectGitHub
+
+# Стиль статусной строки после копирования ответа
+_STATUS_COPIED_STYLE = "color: rgba(100, 220, 100, 200); font-size: 11px;"
 
 class Mode(Enum):
     """Режимы работы окна"""
@@ -25,9 +120,103 @@ class Mode(Enum):
     INPUT = 1
     ANSWER = 2
 
+class _HistoryLoader(QObject):
+    """Передача результата загрузки истории из пула потоков в UI-поток"""
+    
+    # Номер запроса загрузки и список записей истории
+    loaded = pyqtSignal(int, object)
+    
+    # Номер рендеринга и полная запись истории (None, если ее нет)
+    item_loaded = pyqtSignal(int, object)
+
+class _HistoryLoadTask(QRunnable):
+    """Чтение истории из базы данных в потоке QThreadPool"""
+    
+    def __init__(self, db_manager, limit, request_id, loader):
+        super().__init__()
+        self.db_manager = db_manager
+        self.limit = limit
+        self.request_id = request_id
+        self.loader = loader
+    
+    def run(self):
+        try:
+            history_items = self.db_manager.get_history_titles(limit=self.limit)
+        except Exception as e:
+            logging.error("Ошибка загрузки истории: %s", e)
+            history_items = []
+        
+        self.loader.loaded.emit(self.request_id, history_items)
+
+class _HistoryItemLoadTask(QRunnable):
+    """Чтение полной записи истории в потоке QThreadPool"""
+    
+    def __init__(self, db_manager, history_id, render_id, loader):
+        super().__init__()
+        self.db_manager = db_manager
+        self.history_id = history_id
+        self.render_id = render_id
+        self.loader = loader
+    
+    def run(self):
+        try:
+            history_item = self.db_manager.get_history_item(self.history_id)
+        except Exception as e:
+            logging.error("Ошибка загрузки записи истории: %s", e)
+            history_item = None
+        
+        self.loader.item_loaded.emit(self.render_id, history_item)
+
+class _MarkdownRenderer(QObject):
+    """Передача документа, построенного в пуле потоков, в UI-поток"""
+    
+    # Номер рендеринга и готовый QTextDocument
+    rendered = pyqtSignal(int, object)
+
+class _MarkdownRenderTask(QRunnable):
+    """Построение QTextDocument из Markdown вне UI-потока"""
+    
+    def __init__(self, text, font, render_id, renderer):
+        super().__init__()
+        self.text = text
+        self.font = font
+        self.render_id = render_id
+        self.renderer = renderer
+    
+    def run(self):
+        document = QTextDocument()
+        document.setDefaultFont(self.font)
+        document.setMarkdown(self.text, MARKDOWN_DIALECT)
+        
+        # Документ будет принадлежать полю ответа в UI-потоке
+        document.moveToThread(self.renderer.thread())
+        self.renderer.rendered.emit(self.render_id, document)
+
+class _QueryEdit(QTextEdit):
+    """Поле ввода запроса: Enter отправляет запрос, Shift/Ctrl+Enter переносит строку"""
+    
+    def __init__(self, on_submit, parent=None):
+        super().__init__(parent)
+        self._on_submit = on_submit
+    
+    def keyPressEvent(self, event):
+        if (event.key() in (Qt.Key.Key_Return, Qt.Key.Key_Enter) and
+                not (event.modifiers() & (Qt.KeyboardModifier.ShiftModifier |
+                                          Qt.KeyboardModifier.ControlModifier))):
+            self._on_submit()
+            return
+        
+        super().keyPressEvent(event)
+
 class ModernWindow(QMainWindow):
     """Современное главное окно приложения FastAsk"""
     
+    # Минимальный интервал между перерисовками ответа при генерации, в мс
+    RENDER_INTERVAL_MS = 75
+    
+    # Ответы длиннее этого числа символов рендерятся целиком в отдельном потоке
+    ASYNC_RENDER_MIN_LENGTH = 4096
+    
     # Сигнал для отправки запроса к API
     send_request = pyqtSignal(str, object)
     
@@ -44,6 +233,9 @@ class ModernWindow(QMainWindow):
         # Текущий режим отображения
         self.current_mode = Mode.HISTORY
         
+        # Смещение курсора относительно окна при перетаскивании
+        self._drag_offset = None
+        
         # Настраиваем окно
         self._setup_window()
         
@@ -56,6 +248,42 @@ class ModernWindow(QMainWindow):
         # Состояние генерации ответа
         self.is_generating = False
         
+        # Текст текущего ответа (None - ответа еще нет)
+        self.current_response = None
+        
+        # Состояние потокового рендеринга: длина уже отрисованной части
+        # current_response и позиция ее конца в документе поля ответа
+        self._rendered_len = 0
+        self._committed_pos = 0
+        
+        # Пока окно скрыто, ответ и история не перерисовываются;
+        # отложенное обновление выполняется в showEvent
+        self._pending_render = False
+        self._history_dirty = False
+        
+        # Части ответа, пришедшие за интервал, отрисовываются одним проходом
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(self.RENDER_INTERVAL_MS)
+        self._flush_timer.timeout.connect(self._flush_pending_chunk)
+        
+        # Полный рендеринг длинных ответов: один поток, результат приходит
+        # сигналом и применяется, только если номер рендеринга актуален
+        self._render_id = 0
+        self._render_pool = QThreadPool(self)
+        self._render_pool.setMaxThreadCount(1)
+        self._renderer = _MarkdownRenderer(self)
+        self._renderer.rendered.connect(self._on_markdown_rendered)
+        
+        # История читается в пуле потоков, результат приходит сигналом
+        self._history_request_id = 0
+        self._history_loader = _HistoryLoader(self)
+        self._history_loader.loaded.connect(self._on_history_loaded)
+        self._history_loader.item_loaded.connect(self._on_history_item_loaded)
+        
+        # id записей в списке истории, в порядке отображения
+        self._history_cache = []
+        
         # Загружаем историю запросов
         self._load_history()
         
@@ -86,12 +314,13 @@ class ModernWindow(QMainWindow):
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
         
-        # Добавляем эффект тени
-        shadow = QGraphicsDropShadowEffect()
-        shadow.setBlurRadius(20)
-        shadow.setColor(QColor(0, 0, 0, 100))
-        shadow.setOffset(0, 0)
-        self.central_widget.setGraphicsEffect(shadow)
+        # Добавляем эффект тени (отключается на время генерации: с ним каждая
+        # перерисовка ответа заново размывает все окно)
+        self._shadow = QGraphicsDropShadowEffect()
+        self._shadow.setBlurRadius(20)
+        self._shadow.setColor(QColor(0, 0, 0, 100))
+        self._shadow.setOffset(0, 0)
+        self.central_widget.setGraphicsEffect(self._shadow)
         
         # Основной лейаут
         self.main_layout = QVBoxLayout(self.central_widget)
@@ -101,12 +330,7 @@ class ModernWindow(QMainWindow):
         # Создаем и стилизуем фрейм для красивого фона
         self.bg_frame = QFrame(self.central_widget)
         self.bg_frame.setObjectName("bgFrame")
-        self.bg_frame.setStyleSheet("""
-            QFrame#bgFrame {
-                background-color: rgba(30, 30, 35, 220);
-                border-radius: 15px;
-            }
-        """)
+        self.bg_frame.setStyleSheet(_APP_STYLE)
         self.bg_layout = QVBoxLayout(self.bg_frame)
         self.bg_layout.setContentsMargins(20, 20, 20, 20)
         self.bg_layout.setSpacing(15)
@@ -115,46 +339,73 @@ class ModernWindow(QMainWindow):
         self.main_layout.addWidget(self.bg_frame)
         
         # Поле ввода запроса с авторесайзом
-        self.query_input = QTextEdit()
+        # Enter обрабатывается в самом поле, без фильтра событий
+        self.query_input = _QueryEdit(self._on_send_clicked)
         self.query_input.setPlaceholderText("Задайте вопрос или нажмите ? для списка команд...")
         self.query_input.setAcceptRichText(False)
-        self.query_input.setStyleSheet("""
-            QTextEdit {
-                background-color: rgba(45, 45, 50, 150);
-                color: white;
-                border: none;
-                border-radius: 10px;
-                padding: 10px;
-                font-size: 14px;
-            }
-        """)
+        self.query_input.setObjectName("queryInput")
+        self.bg_layout.addWidget(self.query_input)
+        # Шрифт из общей таблицы стилей применяется при полировке виджета
+        self.query_input.ensurePolished()
         # Установка минимальной высоты для одной строки и максимальной для 4 строк
         line_height = QFontMetrics(self.query_input.font()).lineSpacing()
         self.query_input.setMinimumHeight(line_height + 30)  # +30 для учета внутренних отступов
         self.query_input.setMaximumHeight(line_height * 4 + 30)  # Максимум 4 строки, потом скролл
-        self.bg_layout.addWidget(self.query_input)
+        
+        # Поле ответа создается при первом переходе в режим ответа
+        self.response_container = None
+        
+        # Список истории (изначально видим)
+        self.history_list = QListWidget()
+        self.history_list.setObjectName("historyList")
+        self.bg_layout.addWidget(self.history_list)
+        
+        # Индикатор состояния и подсказки
+        self.status_layout = QHBoxLayout()
+        
+        # Информация о скриншоте и статус
+        self.status_label = QLabel("Ctrl+Shift+S для скриншота")
+        self.status_label.setObjectName("statusLabel")
+        self.status_layout.addWidget(self.status_label)
+        
+        # Распорка
+        self.status_layout.addStretch(1)
+        
+        # Кнопка для отмены/остановки
+        self.cancel_button = QPushButton("✕")
+        self.cancel_button.setToolTip("Закрыть окно (Esc)")
+        self.cancel_button.setObjectName("cancelBtn")
+        self.cancel_button.clicked.connect(self.hide)
+        
+        # Кнопка стоп (только при генерации)
+        self.stop_button = QPushButton("⏹")
+        self.stop_button.setToolTip("Остановить генерацию (Esc)")
+        self.stop_button.setObjectName("stopBtn")
+        self.stop_button.clicked.connect(self._stop_generation)
+        self.stop_button.setVisible(False)
+        
+        # Добавляем кнопки 
+        self.status_layout.addWidget(self.stop_button)
+        self.status_layout.addWidget(self.cancel_button)
+        
+        # Добавляем статусный лейаут в основной
+        self.bg_layout.addLayout(self.status_layout)
+    
+    def _ensure_answer_widgets(self):
+        """Создание поля ответа и кнопки копирования при первом использовании"""
+        if self.response_container is not None:
+            return
         
         # Лейаут для поля ответа и кнопки копирования
         self.response_layout = QVBoxLayout()
         
-        # Поле для вывода ответа (изначально скрыто)
+        # Поле для вывода ответа
         self.response_output = QTextEdit()
         self.response_output.setReadOnly(True)
-        self.response_output.setVisible(False)
-        self.response_output.setStyleSheet("""
-            QTextEdit {
-                background-color: rgba(45, 45, 50, 120);
-                color: white;
-                border: none;
-                border-radius: 10px;
-                padding: 10px;
-                font-size: 14px;
-            }
-        """)
+        self.response_output.setObjectName("responseOutput")
         
         # Контейнер для поля ответа и кнопки копирования
         self.response_container = QWidget()
-        self.response_container.setVisible(False)
         self.response_container_layout = QHBoxLayout(self.response_container)
         self.response_container_layout.setContentsMargins(0, 0, 0, 0)
         self.response_container_layout.setSpacing(10)
@@ -170,23 +421,7 @@ class ModernWindow(QMainWindow):
         # Кнопка копирования
         self.copy_button = QPushButton("📋")
         self.copy_button.setToolTip("Копировать ответ в буфер обмена")
-        self.copy_button.setStyleSheet("""
-            QPushButton {
-                background-color: rgba(60, 60, 65, 150);
-                color: white;
-                border: none;
-                border-radius: 5px;
-                padding: 5px;
-                font-size: 14px;
-                min-width: 30px;
-                max-width: 30px;
-                min-height: 30px;
-                max-height: 30px;
-            }
-            QPushButton:hover {
-                background-color: rgba(80, 80, 85, 200);
-            }
-        """)
+        self.copy_button.setObjectName("copyBtn")
         self.copy_button.clicked.connect(self._copy_response)
         
         # Добавляем кнопку копирования в вертикальный лейаут с растяжкой сверху
@@ -197,94 +432,8 @@ class ModernWindow(QMainWindow):
         # Добавляем вертикальный лейаут в контейнер
         self.response_container_layout.addLayout(self.copy_button_layout)
         
-        # Добавляем контейнер в основной лейаут
-        self.bg_layout.addWidget(self.response_container)
-        
-        # Список истории (изначально видим)
-        self.history_list = QListWidget()
-        self.history_list.setStyleSheet("""
-            QListWidget {
-                background-color: transparent;
-                color: white;
-                border: none;
-                font-size: 14px;
-            }
-            QListWidget::item {
-                padding: 8px;
-                margin: 2px 0px;
-                border-radius: 5px;
-            }
-            QListWidget::item:hover {
-                background-color: rgba(60, 60, 65, 150);
-            }
-            QListWidget::item:selected {
-                background-color: rgba(70, 130, 180, 150);
-            }
-        """)
-        self.bg_layout.addWidget(self.history_list)
-        
-        # Индикатор состояния и подсказки
-        self.status_layout = QHBoxLayout()
-        
-        # Информация о скриншоте и статус
-        self.status_label = QLabel("Ctrl+Shift+S для скриншота")
-        self.status_label.setStyleSheet("color: rgba(200, 200, 200, 150); font-size: 11px;")
-        self.status_layout.addWidget(self.status_label)
-        
-        # Распорка
-        self.status_layout.addStretch(1)
-        
-        # Кнопка для отмены/остановки
-        self.cancel_button = QPushButton("✕")
-        self.cancel_button.setToolTip("Закрыть окно (Esc)")
-        self.cancel_button.setStyleSheet("""
-            QPushButton {
-                background-color: rgba(180, 40, 40, 150);
-                color: white;
-                border: none;
-                border-radius: 15px;
-                padding: 5px;
-                font-size: 12px;
-                min-width: 30px;
-                max-width: 30px;
-                min-height: 30px;
-                max-height: 30px;
-            }
-            QPushButton:hover {
-                background-color: rgba(220, 40, 40, 200);
-            }
-        """)
-        self.cancel_button.clicked.connect(self.hide)
-        
-        # Кнопка стоп (только при генерации)
-        self.stop_button = QPushButton("⏹")
-        self.stop_button.setToolTip("Остановить генерацию (Esc)")
-        self.stop_button.setStyleSheet("""
-            QPushButton {
-                background-color: rgba(40, 120, 180, 150);
-                color: white;
-                border: none;
-                border-radius: 15px;
-                padding: 5px;
-                font-size: 12px;
-                min-width: 30px;
-                max-width: 30px;
-                min-height: 30px;
-                max-height: 30px;
-            }
-            QPushButton:hover {
-                background-color: rgba(40, 150, 220, 200);
-            }
-        """)
-        self.stop_button.clicked.connect(self._stop_generation)
-        self.stop_button.setVisible(False)
-        
-        # Добавляем кнопки 
-        self.status_layout.addWidget(self.stop_button)
-        self.status_layout.addWidget(self.cancel_button)
-        
-        # Добавляем статусный лейаут в основной
-        self.bg_layout.addLayout(self.status_layout)
+        # Добавляем контейнер в основной лейаут между полем ввода и историей
+        self.bg_layout.insertWidget(self.bg_layout.indexOf(self.history_list), self.response_container)
     
     def _connect_signals(self):
         """Подключение обработчиков сигналов"""
@@ -292,36 +441,12 @@ class ModernWindow(QMainWindow):
         self.esc_shortcut = QShortcut(QKeySequence("Esc"), self)
         self.esc_shortcut.activated.connect(self._handle_escape)
         
-        # Отправка запроса по Enter (если не зажат Shift или Ctrl)
-        self.query_input.installEventFilter(self)
-        
         # Отслеживаем изменения в поле ввода
         self.query_input.textChanged.connect(self._on_input_changed)
         
         # Клик по элементу истории
         self.history_list.itemClicked.connect(self._on_history_item_clicked)
     
-    def eventFilter(self, obj, event):
-        """Обработка событий для перехвата нажатия Enter"""
-        from PyQt6.QtCore import QEvent
-        from PyQt6.QtGui import QKeyEvent
-        
-        if obj is self.query_input and event.type() == QEvent.Type.KeyPress:
-            # Правильно получаем событие клавиатуры - оно уже является QKeyEvent
-            if isinstance(event, QKeyEvent):
-                
-                # Обрабатываем Enter для отправки запроса (без Shift или Ctrl)
-                if (event.key() == Qt.Key.Key_Return or 
-                    event.key() == Qt.Key.Key_Enter):
-                    
-                    # Если зажаты Shift или Ctrl, просто пропускаем для обычного переноса строки
-                    if not (event.modifiers() & (Qt.KeyboardModifier.ShiftModifier | 
-                                                Qt.KeyboardModifier.ControlModifier)):
-                        self._on_send_clicked()
-                        return True
-        
-        return super().eventFilter(obj, event)
-    
     def _handle_escape(self):
         """Обработка нажатия Escape"""
         if self.is_generating:
@@ -348,13 +473,18 @@ class ModernWindow(QMainWindow):
         Args:
             new_mode (Mode): Новый режим отображения
         """
+        # Режим не меняется - виджеты уже в нужном состоянии
+        if new_mode == self.current_mode:
+            return
+        
         self.current_mode = new_mode
         
         # Анимация смены режима
         if new_mode == Mode.HISTORY:
             # Показываем историю, скрываем поле ответа
             self.history_list.setVisible(True)
-            self.response_container.setVisible(False)
+            if self.response_container is not None:
+                self.response_container.setVisible(False)
             self.query_input.setPlaceholderText("Задайте вопрос или нажмите ? для списка команд...")
             
             # Фокус на поле ввода
@@ -370,8 +500,8 @@ class ModernWindow(QMainWindow):
         elif new_mode == Mode.ANSWER:
             # Показываем ответ, скрываем историю
             self.history_list.setVisible(False)
+            self._ensure_answer_widgets()
             self.response_container.setVisible(True)
-            self.response_output.setVisible(True)
             
             # Плейсхолдер для поля ввода
             self.query_input.setPlaceholderText("Задайте новый вопрос или введите ? для справки...")
@@ -382,7 +512,7 @@ class ModernWindow(QMainWindow):
             else:
                 self.status_label.setText("Введите новый запрос для продолжения")
             
-        self.repaint()  # Принудительное обновление для немедленного отображения изменений
+        self.update()  # Перерисовка в ближайшем цикле событий, вместе с остальными изменениями
     
     def _on_send_clicked(self):
         """Обработка нажатия кнопки отправки запроса"""
@@ -399,12 +529,14 @@ class ModernWindow(QMainWindow):
         
         # Устанавливаем флаг генерации
         self.is_generating = True
+        self._shadow.setEnabled(False)
         
         # Сбрасываем текущий ответ
-        if hasattr(self, 'current_response'):
-            delattr(self, 'current_response')
+        self.current_response = None
         
-        # Очищаем поле ответа
+        # Очищаем поле ответа (и отменяем еще не примененный рендеринг)
+        self._ensure_answer_widgets()
+        self._render_id += 1
         self.response_output.clear()
         
         # Переключаемся в режим ответа
@@ -421,12 +553,11 @@ class ModernWindow(QMainWindow):
         """Прерывание генерации ответа"""
         if self.is_generating:
             # Сохраняем текущее накопленное значение как финальный ответ
-            if hasattr(self, 'current_response'):
+            self._flush_timer.stop()
+            if self.current_response is not None:
                 # Генерируем сообщение о прерывании
                 self.current_response += "\n\n*Генерация прервана пользователем*"
-                # Преобразуем в HTML
-                html_content = markdown.markdown(self.current_response)
-                self.response_output.setHtml(html_content)
+                self._set_markdown(self.current_response)
             
             # Отправляем сигнал остановки
             self.stop_generation.emit()
@@ -440,6 +571,7 @@ class ModernWindow(QMainWindow):
     def _reset_generation_state(self):
         """Сброс состояния генерации ответа"""
         self.is_generating = False
+        self._shadow.setEnabled(True)
         self.stop_button.setVisible(False)
         
         # Обновляем историю
@@ -466,29 +598,123 @@ class ModernWindow(QMainWindow):
     
     def on_response_chunk(self, chunk):
         """Обработка получения части ответа при потоковой генерации"""
-        # Добавляем полученный текст в поле ответа
-        current_text = self.response_output.toHtml()
-        
-        # Если это первый чанк, очищаем поле
-        if not hasattr(self, 'current_response'):
+        # Если это первый чанк, очищаем поле и переключаемся в режим ответа;
+        # остальные чанки только дописываются
+        if self.current_response is None:
             self.current_response = ""
+            self._ensure_answer_widgets()
             self.response_output.clear()
-            current_text = ""
+            self._rendered_len = 0
+            self._committed_pos = 0
+            
+            if self.current_mode != Mode.ANSWER:
+                self._switch_mode(Mode.ANSWER)
+                
+                # Показываем кнопку остановки
+                self.stop_button.setVisible(True)
+                self.status_label.setText("Генерация ответа...")
         
         # Добавляем текст к накопленному ответу
         self.current_response += chunk
         
-        # Преобразуем Markdown в HTML
-        html_content = markdown.markdown(self.current_response)
-        self.response_output.setHtml(html_content)
+        # Перерисовка откладывается до срабатывания таймера
+        if self.isVisible():
+            if not self._flush_timer.isActive():
+                self._flush_timer.start()
+        else:
+            self._pending_render = True
+    
+    def _flush_pending_chunk(self):
+        """Отрисовка частей ответа, накопленных за интервал таймера"""
+        if self.current_response is None:
+            return
         
-        # Переключаемся в режим ответа, если еще не переключились
-        if self.current_mode != Mode.ANSWER:
-            self._switch_mode(Mode.ANSWER)
-            
-            # Показываем кнопку остановки
-            self.stop_button.setVisible(True)
-            self.status_label.setText("Генерация ответа...")
+        if self.isVisible():
+            # Перерисовываем только незавершенный хвост ответа
+            self._render_streamed_response()
+        else:
+            self._pending_render = True
+    
+    def _set_markdown(self, text):
+        """Отображение ответа встроенным в Qt рендерером Markdown"""
+        self.response_output.document().setMarkdown(text, MARKDOWN_DIALECT)
+    
+    def _render_response(self, text):
+        """Полный рендеринг ответа; длинный ответ строится в отдельном потоке"""
+        self._render_id += 1
+        if len(text) < self.ASYNC_RENDER_MIN_LENGTH:
+            self._set_markdown(text)
+            return
+        
+        self._render_pool.start(_MarkdownRenderTask(
+            text, self.response_output.font(), self._render_id, self._renderer
+        ))
+    
+    def _on_markdown_rendered(self, render_id, document):
+        """Подстановка документа, построенного в отдельном потоке"""
+        # Пока документ строился, поле ответа уже получило другое содержимое
+        if render_id != self._render_id:
+            return
+        
+        # Предыдущий документ, принадлежащий полю, удаляется в setDocument
+        document.setParent(self.response_output)
+        self.response_output.setDocument(document)
+    
+    @staticmethod
+    def _find_commit_boundary(text, start):
+        """Конец последнего завершенного markdown-блока в text после start
+        
+        Блок считается завершенным после пустой строки, если она не внутри
+        блока кода ```. Если такого места нет, возвращается start.
+        """
+        pos = text.rfind("\n\n", start)
+        while pos != -1 and text.count("```", 0, pos) % 2:
+            pos = text.rfind("\n\n", start, pos)
+        return start if pos == -1 else pos + 2
+    
+    def _render_streamed_response(self):
+        """Инкрементальный рендеринг ответа во время генерации
+        
+        Завершенные блоки преобразуются из Markdown один раз и дописываются
+        в документ; заново рендерится только хвост после последнего
+        завершенного блока. Итоговый ответ рендерится целиком
+        в on_generation_complete.
+        """
+        text = self.current_response
+        boundary = self._find_commit_boundary(text, self._rendered_len)
+        
+        # Удаляем ранее выведенный хвост
+        cursor = QTextCursor(self.response_output.document())
+        cursor.setPosition(self._committed_pos)
+        cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+        
+        # Дописываем новые завершенные блоки
+        if boundary > self._rendered_len:
+            self._insert_markdown(cursor, text[self._rendered_len:boundary])
+            self._rendered_len = boundary
+            self._committed_pos = cursor.position()
+        
+        # Выводим незавершенный хвост
+        tail = text[self._rendered_len:]
+        if tail.strip():
+            self._insert_markdown(cursor, tail)
+    
+    def _insert_markdown(self, cursor, text):
+        """Вставка фрагмента Markdown отдельными блоками в позицию курсора"""
+        start = cursor.position()
+        
+        # Новый фрагмент начинается с нового абзаца, а не сливается с предыдущим
+        if start:
+            cursor.insertBlock()
+        cursor.insertMarkdown(text, MARKDOWN_DIALECT)
+        
+        # Списки и таблицы создают собственные блоки, и разделитель остается
+        # пустым абзацем - убираем его
+        if start:
+            separator = self.response_output.document().findBlock(start + 1)
+            if separator.length() == 1 and separator.next().isValid():
+                QTextCursor(separator).deletePreviousChar()
     
     def on_generation_complete(self, full_response):
         """Обработка завершения генерации ответа"""
@@ -496,12 +722,17 @@ class ModernWindow(QMainWindow):
         if not self.is_generating:
             return
             
+        # Итоговый ответ рендерится целиком, отложенная перерисовка не нужна
+        self._flush_timer.stop()
+        
         # Сохраняем полный ответ
         self.current_response = full_response
         
-        # Преобразуем Markdown в HTML
-        html_content = markdown.markdown(full_response)
-        self.response_output.setHtml(html_content)
+        # Отображаем Markdown
+        if self.isVisible():
+            self._render_response(full_response)
+        else:
+            self._pending_render = True
         
         # Скрываем кнопку остановки
         self.stop_button.setVisible(False)
@@ -514,31 +745,65 @@ class ModernWindow(QMainWindow):
         
         # Генерация завершена
         self.is_generating = False
+        self._shadow.setEnabled(True)
         
         # Обновляем историю запросов
         self._load_history()
     
     def _load_history(self):
-        """Загрузка истории запросов"""
-        # Очищаем список
-        self.history_list.clear()
+        """Загрузка истории запросов (чтение из БД вне UI-потока)"""
+        if not hasattr(self.app, 'db_manager'):
+            return
+        
+        # Скрытому окну список не нужен - загрузим при показе
+        if not self.isVisible():
+            self._history_dirty = True
+            return
+        self._history_dirty = False
+        
+        # Результаты более ранних загрузок будут проигнорированы
+        self._history_request_id += 1
         
         # Получаем историю из базы данных (10 последних запросов)
-        if hasattr(self.app, 'db_manager'):
-            history_items = self.app.db_manager.get_history(limit=10, offset=0)
-            
-            # Если есть история, добавляем элементы в список
-            if history_items:
-                for item in reversed(history_items):  # Показываем новые сверху
-                    # Создаем элемент списка
-                    list_item = QListWidgetItem(item['query'][:60] + ('...' if len(item['query']) > 60 else ''))
-                    list_item.setToolTip(item['query'])
-                    
-                    # Сохраняем полные данные в элемент
-                    list_item.setData(Qt.ItemDataRole.UserRole, item)
-                    
-                    # Добавляем элемент в список
+        QThreadPool.globalInstance().start(_HistoryLoadTask(
+            self.app.db_manager, 10, self._history_request_id, self._history_loader
+        ))
+    
+    def _on_history_loaded(self, request_id, history_items):
+        """Заполнение списка истории загруженными записями"""
+        if request_id != self._history_request_id:
+            return
+        
+        # Обновление одним проходом: без промежуточных перерисовок и сигналов
+        self.history_list.setUpdatesEnabled(False)
+        self.history_list.blockSignals(True)
+        try:
+            # Существующие элементы обновляем на месте, лишние удаляем,
+            # недостающие добавляем - без полной пересборки списка
+            for index, item in enumerate(history_items):
+                list_item = self.history_list.item(index)
+                if list_item is None:
+                    list_item = QListWidgetItem()
                     self.history_list.addItem(list_item)
+                elif index < len(self._history_cache) and self._history_cache[index] == item['id']:
+                    # Тот же запрос: достаточно обновить сохраненные данные
+                    list_item.setData(Qt.ItemDataRole.UserRole, item)
+                    continue
+                
+                # Заголовок уже обрезан в SQL-запросе
+                list_item.setText(item['title'])
+                list_item.setToolTip(item['query'])
+                
+                # Сохраняем данные записи в элемент
+                list_item.setData(Qt.ItemDataRole.UserRole, item)
+            
+            while self.history_list.count() > len(history_items):
+                self.history_list.takeItem(self.history_list.count() - 1)
+        finally:
+            self.history_list.blockSignals(False)
+            self.history_list.setUpdatesEnabled(True)
+        
+        self._history_cache = [item['id'] for item in history_items]
     
     def _on_history_item_clicked(self, item):
         """Обработка клика по элементу истории"""
@@ -549,19 +814,33 @@ class ModernWindow(QMainWindow):
             # Заполняем поле ввода текстом запроса
             self.query_input.setPlainText(history_item['query'])
             
-            # Устанавливаем ответ
-            self.response_output.setPlainText(history_item['response'])
+            # Список не хранит ответ: он читается из БД в пуле потоков
+            # и подставляется, если за это время не начат новый ответ
+            self._ensure_answer_widgets()
+            self._render_id += 1
+            self.response_output.clear()
+            QThreadPool.globalInstance().start(_HistoryItemLoadTask(
+                self.app.db_manager, history_item['id'], self._render_id, self._history_loader
+            ))
             
             # Переключаемся в режим ответа
             self._switch_mode(Mode.ANSWER)
             
             # Сбрасываем состояние генерации (ответ уже готов)
             self.is_generating = False
+            self._shadow.setEnabled(True)
             self.stop_button.setVisible(False)
             
             # Обновляем статус
             self.status_label.setText("Из истории • Ctrl+Shift+S для нового запроса со скриншотом")
     
+    def _on_history_item_loaded(self, render_id, history_item):
+        """Вывод ответа из загруженной записи истории"""
+        if render_id != self._render_id:
+            return
+        
+        self.response_output.setPlainText(history_item['response'] if history_item else "")
+    
     def show_hide(self):
         """Показать/скрыть окно приложения"""
         if self.isVisible():
@@ -589,6 +868,24 @@ class ModernWindow(QMainWindow):
         # Перемещаем окно в новую позицию
         self.move(frame_geometry.topLeft())
     
+    def showEvent(self, event):
+        """Отложенное обновление ответа и истории при показе окна"""
+        super().showEvent(event)
+        
+        if self._pending_render and self.current_response is not None:
+            if self.is_generating:
+                # Рендерим накопленное заново, дальше - инкрементально
+                self.response_output.clear()
+                self._rendered_len = 0
+                self._committed_pos = 0
+                self._render_streamed_response()
+            else:
+                self._render_response(self.current_response)
+        self._pending_render = False
+        
+        if self._history_dirty:
+            self._load_history()
+    
     def closeEvent(self, event):
         """Обработка события закрытия окна"""
         # Сохраняем положение и размер окна
@@ -599,28 +896,26 @@ class ModernWindow(QMainWindow):
     
     def mousePressEvent(self, event):
         """Обработка нажатия кнопки мыши"""
-        # Запоминаем позицию для перетаскивания окна
+        # Запоминаем смещение курсора относительно окна для перетаскивания
         if event.button() == Qt.MouseButton.LeftButton:
-            self._drag_pos = event.globalPosition().toPoint()
+            self._drag_offset = event.globalPosition().toPoint() - self.frameGeometry().topLeft()
     
     def mouseMoveEvent(self, event):
         """Обработка движения мыши"""
         # Перетаскивание окна
-        if hasattr(self, '_drag_pos') and event.buttons() & Qt.MouseButton.LeftButton:
-            diff = event.globalPosition().toPoint() - self._drag_pos
-            self.move(self.pos() + diff)
-            self._drag_pos = event.globalPosition().toPoint()
+        if self._drag_offset is not None and event.buttons() & Qt.MouseButton.LeftButton:
+            self.move(event.globalPosition().toPoint() - self._drag_offset)
     
     def _copy_response(self):
         """Копирует текст ответа в буфер обмена"""
-        if hasattr(self, 'current_response'):
+        if self.current_response is not None:
             clipboard = QApplication.clipboard()
             clipboard.setText(self.current_response)
             
             # Показываем временное сообщение о копировании
             previous_text = self.status_label.text()
             self.status_label.setText("Ответ скопирован в буфер обмена")
-            self.status_label.setStyleSheet("color: rgba(100, 220, 100, 200); font-size: 11px;")
+            self.status_label.setStyleSheet(_STATUS_COPIED_STYLE)
             
             # Через 2 секунды возвращаем предыдущий текст
             QTimer.singleShot(2000, lambda: self._reset_status_label(previous_text))
@@ -628,4 +923,5 @@ class ModernWindow(QMainWindow):
     def _reset_status_label(self, text):
         """Возвращает статусному сообщению предыдущий текст и стиль"""
         self.status_label.setText(text)
-        self.status_label.setStyleSheet("color: rgba(200, 200, 200, 150); font-size: 11px;")
\ No newline at end of file
+        # Без собственного стиля метка снова берет стиль из _APP_STYLE
+        self.status_label.setStyleSheet("")
\ No newline at end of file
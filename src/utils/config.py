@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Конфигурация приложения, считываемая из переменных окружения
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+
+def _env_bool(value):
+    """Преобразование строки из .env в bool"""
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(slots=True, frozen=True)
+class AppConfig:
+    """Неизменяемый снимок настроек приложения
+    
+    Создается один раз при запуске (и при перезагрузке настроек), чтобы
+    компоненты читали готовые типизированные поля вместо os.getenv.
+    """
+    
+    theme: str = "dark"
+    log_level: str = "INFO"
+    db_path: str = "data/history.db"
+    screenshots_dir: str = "data/screenshots"
+    save_screenshots: bool = True
+    quantize_screenshots: bool = False
+    use_modern_ui: bool = True
+    app_hotkey: str = "ctrl+shift+space"
+    screenshot_hotkey: str = "ctrl+shift+s"
+    model: str = "google/gemini-2.5-flash"
+    temperature: float = 0.7
+    max_tokens: int = 1000
+    system_prompt: str = "Ты полезный ассистент. Отвечай кратко и по делу."
+    api_key: Optional[str] = None
+    api_url: str = "https://api.openai.com"
+    
+    @classmethod
+    def from_env(cls, environ=None):
+        """Создание конфигурации из переменных окружения
+        
+        Args:
+            environ (Mapping, optional): Источник переменных (по умолчанию os.environ)
+            
+        Returns:
+            AppConfig: Конфигурация приложения
+        """
+        env = os.environ if environ is None else environ
+        
+        # Значения по умолчанию (при slots=True они недоступны как атрибуты класса)
+        default = cls()
+        return cls(
+            theme=env.get("THEME", default.theme),
+            log_level=env.get("LOG_LEVEL", default.log_level),
+            db_path=env.get("DB_PATH", default.db_path),
+            screenshots_dir=env.get("SCREENSHOTS_DIR", default.screenshots_dir),
+            save_screenshots=_env_bool(env.get("SAVE_SCREENSHOTS", "true")),
+            quantize_screenshots=_env_bool(env.get("QUANTIZE_SCREENSHOTS", "false")),
+            use_modern_ui=_env_bool(env.get("USE_MODERN_UI", "true")),
+            app_hotkey=env.get("APP_HOTKEY", default.app_hotkey),
+            screenshot_hotkey=env.get("SCREENSHOT_HOTKEY", default.screenshot_hotkey),
+            model=env.get("OPENAI_MODEL", default.model),
+            temperature=float(env.get("TEMPERATURE", default.temperature)),
+            max_tokens=int(env.get("MAX_TOKENS", default.max_tokens)),
+            system_prompt=env.get("SYSTEM_PROMPT", default.system_prompt),
+            api_key=env.get("OPENAI_API_KEY"),
+            api_url=env.get("OPENAI_API_URL", default.api_url),
+        )
@@ -6,9 +6,203 @@
 """
 
 import os
+import sys
+import queue
 import logging
 import threading
-import keyboard
+from concurrent.futures import Future
+
+try:
+    import keyboard
+except ImportError:  # keyboard нужен только там, где нет системной регистрации
+    keyboard = None
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+# Модификаторы и коды клавиш Win32 для RegisterHotKey
+_WIN_MOD_ALT = 0x0001
+_WIN_MOD_CONTROL = 0x0002
+_WIN_MOD_SHIFT = 0x0004
+_WIN_MOD_WIN = 0x0008
+_WIN_MOD_NOREPEAT = 0x4000
+
+_WIN_MODIFIERS = {
+    "ctrl": _WIN_MOD_CONTROL,
+    "control": _WIN_MOD_CONTROL,
+    "shift": _WIN_MOD_SHIFT,
+    "alt": _WIN_MOD_ALT,
+    "win": _WIN_MOD_WIN,
+    "windows": _WIN_MOD_WIN,
+}
+
+_WIN_KEYS = {
+    "space": 0x20,
+    "enter": 0x0D,
+    "return": 0x0D,
+    "tab": 0x09,
+    "esc": 0x1B,
+    "escape": 0x1B,
+    "backspace": 0x08,
+    "insert": 0x2D,
+    "delete": 0x2E,
+    "home": 0x24,
+    "end": 0x23,
+    "page up": 0x21,
+    "page down": 0x22,
+    "left": 0x25,
+    "up": 0x26,
+    "right": 0x27,
+    "down": 0x28,
+    "print screen": 0x2C,
+}
+
+def _parse_windows_hotkey(hotkey):
+    """Разбор комбинации вида 'ctrl+shift+space' в (модификаторы, код клавиши)
+    
+    Returns:
+        tuple or None: None, если комбинацию нельзя выразить через RegisterHotKey
+    """
+    modifiers = 0
+    vk = None
+    for part in hotkey.lower().split("+"):
+        part = part.strip()
+        if part in _WIN_MODIFIERS:
+            modifiers |= _WIN_MODIFIERS[part]
+        elif vk is not None:
+            # RegisterHotKey поддерживает только одну основную клавишу
+            return None
+        elif len(part) == 1 and part.isascii() and part.isalnum():
+            vk = ord(part.upper())
+        elif part in _WIN_KEYS:
+            vk = _WIN_KEYS[part]
+        elif part[:1] == "f" and part[1:].isdigit() and 1 <= int(part[1:]) <= 24:
+            vk = 0x6F + int(part[1:])
+        else:
+            return None
+    
+    if vk is None:
+        return None
+    return modifiers, vk
+
+class _WindowsHotkeys:
+    """Системные хоткеи Windows через RegisterHotKey
+    
+    Система присылает WM_HOTKEY только при нажатии зарегистрированной
+    комбинации, поэтому, в отличие от глобального хука keyboard, процесс
+    не просыпается на каждое нажатие клавиши. RegisterHotKey привязывает
+    хоткей к потоку, поэтому регистрация, удаление и прием сообщений
+    выполняются в одном потоке с циклом сообщений.
+    """
+    
+    WM_QUIT = 0x0012
+    WM_HOTKEY = 0x0312
+    # Пробуждение потока для выполнения команд из очереди
+    WM_APP_COMMAND = 0x8000
+    
+    def __init__(self):
+        self._user32 = ctypes.WinDLL("user32", use_last_error=True)
+        self._kernel32 = ctypes.WinDLL("kernel32")
+        
+        # Команды (регистрация/удаление) для потока цикла сообщений
+        self._commands = queue.Queue()
+        
+        # id хоткея -> callback и комбинация -> id хоткея
+        self._callbacks = {}
+        self._ids = {}
+        self._next_id = 1
+        
+        self._thread_id = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="WinHotkeys", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+    
+    def register(self, hotkey, callback):
+        """Регистрация хоткея; False, если комбинация не поддерживается или занята"""
+        parsed = _parse_windows_hotkey(hotkey)
+        if parsed is None:
+            return False
+        return self._call(self._register, hotkey, parsed, callback)
+    
+    def unregister(self, hotkey):
+        """Удаление хоткея, зарегистрированного через register"""
+        return self._call(self._unregister, hotkey)
+    
+    def stop(self):
+        """Завершение цикла сообщений; хоткеи снимаются в потоке цикла"""
+        self._user32.PostThreadMessageW(self._thread_id, self.WM_QUIT, 0, 0)
+        self._thread.join(timeout=1)
+    
+    def _call(self, func, *args):
+        """Выполнение func в потоке цикла сообщений с ожиданием результата"""
+        done = threading.Event()
+        result = []
+        
+        def command():
+            try:
+                result.append(func(*args))
+            finally:
+                done.set()
+        
+        self._commands.put(command)
+        if not self._user32.PostThreadMessageW(self._thread_id, self.WM_APP_COMMAND, 0, 0):
+            return False
+        done.wait()
+        return bool(result and result[0])
+    
+    def _register(self, hotkey, parsed, callback):
+        modifiers, vk = parsed
+        hotkey_id = self._next_id
+        if not self._user32.RegisterHotKey(None, hotkey_id, modifiers | _WIN_MOD_NOREPEAT, vk):
+            logging.warning("RegisterHotKey не зарегистрировал %s (код ошибки %s)",
+                            hotkey, ctypes.get_last_error())
+            return False
+        
+        self._next_id += 1
+        self._ids[hotkey] = hotkey_id
+        self._callbacks[hotkey_id] = callback
+        return True
+    
+    def _unregister(self, hotkey):
+        hotkey_id = self._ids.pop(hotkey, None)
+        if hotkey_id is None:
+            return False
+        
+        del self._callbacks[hotkey_id]
+        return bool(self._user32.UnregisterHotKey(None, hotkey_id))
+    
+    def _run(self):
+        """Цикл сообщений потока: WM_HOTKEY и команды из очереди"""
+        msg = wintypes.MSG()
+        
+        # Создаем очередь сообщений потока до того, как в нее начнут писать
+        self._user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, 0)
+        self._thread_id = self._kernel32.GetCurrentThreadId()
+        self._ready.set()
+        
+        while self._user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            if msg.message == self.WM_HOTKEY:
+                callback = self._callbacks.get(msg.wParam)
+                if callback is not None:
+                    try:
+                        callback()
+                    except Exception as e:
+                        logging.error(f"Ошибка в обработчике хоткея: {str(e)}")
+            elif msg.message == self.WM_APP_COMMAND:
+                while True:
+                    try:
+                        command = self._commands.get_nowait()
+                    except queue.Empty:
+                        break
+                    command()
+        
+        # Хоткеи снимаются в том же потоке, где были зарегистрированы
+        for hotkey_id in self._callbacks:
+            self._user32.UnregisterHotKey(None, hotkey_id)
+        self._callbacks.clear()
+        self._ids.clear()
 
 class HotkeyManager:
     """Класс для регистрации и управления глобальными хоткеями"""
@@ -16,7 +210,6 @@ class HotkeyManager:
     def __init__(self):
         """Инициализация менеджера хоткеев"""
         self.registered_hotkeys = {}
-        self.running = True
         
         # Создаем список для хранения зарегистрированных хоткеев
         self.hotkeys_list = []
@@ -24,10 +217,25 @@ class HotkeyManager:
         # Флаг для отладки - если включен, хоткеи не регистрируются системно
         self.debug_mode = os.getenv("DEBUG_HOTKEYS", "0").lower() in ("1", "true", "yes")
         
+        # Хоткеи, зарегистрированные системно (остальные - через keyboard)
+        self._native_hotkeys = set()
+        self._native = None
+        
         if not self.debug_mode:
-            # Запускаем мониторинг в отдельном потоке с пониженным приоритетом
-            self.monitor_thread = threading.Thread(target=self._monitor_hotkeys, daemon=True)
-            self.monitor_thread.start()
+            # На Windows комбинации регистрируются в системе (RegisterHotKey);
+            # keyboard остается запасным вариантом и обрабатывает нажатия
+            # в собственном потоке хука
+            if sys.platform == "win32":
+                try:
+                    self._native = _WindowsHotkeys()
+                except Exception as e:
+                    logging.warning(f"Системные хоткеи недоступны, используется keyboard: {str(e)}")
+            
+            # Регистрации выполняются одним фоновым потоком по очереди,
+            # чтобы не задерживать запуск интерфейса
+            self._pending = queue.Queue()
+            self._worker = threading.Thread(target=self._registration_loop, name="HotkeyRegistration", daemon=True)
+            self._worker.start()
             
             logging.info("Менеджер хоткеев инициализирован")
         else:
@@ -36,17 +244,54 @@ class HotkeyManager:
     def register_hotkey(self, hotkey, callback):
         """Регистрация хоткея и привязка его к функции обратного вызова
         
+        Сама регистрация выполняется в фоновом потоке, метод возвращается сразу.
+        
         Args:
             hotkey (str): Комбинация клавиш (например, 'ctrl+shift+space')
             callback (callable): Функция, которая будет вызвана при нажатии хоткея
+            
+        Returns:
+            Future: Результат регистрации (True при успехе)
         """
+        future = Future()
+        
         # В режиме отладки просто сохраняем хоткей без системной регистрации
         if self.debug_mode:
             self.registered_hotkeys[hotkey] = callback
             self.hotkeys_list.append(hotkey)
             logging.info(f"Хоткей сохранен (без системной регистрации): {hotkey}")
+            future.set_result(True)
+            return future
+        
+        self._pending.put((hotkey, callback, future))
+        return future
+    
+    def _registration_loop(self):
+        """Фоновый поток: регистрация хоткеев из очереди (None - завершение)"""
+        while True:
+            task = self._pending.get()
+            try:
+                if task is None:
+                    return
+                hotkey, callback, future = task
+                future.set_result(self._register(hotkey, callback))
+            finally:
+                self._pending.task_done()
+    
+    def _register(self, hotkey, callback):
+        """Регистрация хоткея в системе или через keyboard (в фоновом потоке)"""
+        # Сначала пробуем системную регистрацию
+        if self._native is not None and self._native.register(hotkey, callback):
+            self._native_hotkeys.add(hotkey)
+            self.registered_hotkeys[hotkey] = callback
+            self.hotkeys_list.append(hotkey)
+            logging.info(f"Зарегистрирован системный хоткей: {hotkey}")
             return True
-            
+        
+        if keyboard is None:
+            logging.error(f"Не удалось зарегистрировать хоткей {hotkey}: библиотека keyboard не установлена")
+            return False
+        
         # Регистрируем обработчик для данного хоткея
         try:
             keyboard.add_hotkey(hotkey, callback, suppress=False)
@@ -70,10 +315,17 @@ class HotkeyManager:
                 del self.registered_hotkeys[hotkey]
                 logging.info(f"Хоткей удален из списка: {hotkey}")
             return True
-            
+        
+        # Дожидаемся регистраций, поставленных в очередь раньше
+        self._pending.join()
+        
         if hotkey in self.registered_hotkeys:
             try:
-                keyboard.remove_hotkey(hotkey)
+                if hotkey in self._native_hotkeys:
+                    self._native.unregister(hotkey)
+                    self._native_hotkeys.discard(hotkey)
+                else:
+                    keyboard.remove_hotkey(hotkey)
                 self.hotkeys_list.remove(hotkey)
                 del self.registered_hotkeys[hotkey]
                 logging.info(f"Удален хоткей: {hotkey}")
@@ -83,17 +335,6 @@ class HotkeyManager:
                 return False
         return False
     
-    def _monitor_hotkeys(self):
-        """Фоновый мониторинг хоткеев с низким потреблением ресурсов"""
-        # Снижаем приоритет потока для уменьшения нагрузки на систему
-        try:
-            import time
-            # Устанавливаем большой интервал сна для снижения CPU нагрузки
-            while self.running:
-                time.sleep(0.5)  # Увеличенный интервал для снижения нагрузки
-        except Exception as e:
-            logging.error(f"Ошибка в мониторинге хоткеев: {str(e)}")
-    
     def get_registered_hotkeys(self):
         """Получение списка зарегистрированных хоткеев"""
         return self.hotkeys_list
@@ -103,11 +344,17 @@ class HotkeyManager:
         if self.debug_mode:
             logging.info("Остановка менеджера хоткеев (режим отладки)")
             return
-            
-        self.running = False
         
         # Удаляем все зарегистрированные хоткеи
+        self._pending.join()
         for hotkey in list(self.registered_hotkeys.keys()):
             self.unregister_hotkey(hotkey)
         
+        # Завершаем поток регистрации
+        self._pending.put(None)
+        self._worker.join(timeout=1)
+        
+        if self._native is not None:
+            self._native.stop()
+        
         logging.info("Менеджер хоткеев остановлен") 
\ No newline at end of file
@@ -5,19 +5,287 @@
 Модуль для работы со скриншотами
 """
 
+import io
 import os
-import base64
+import mmap
+import sys
+import shutil
+import time
 import logging
 import tempfile
+import subprocess
 from pathlib import Path
-from datetime import datetime
+from typing import NamedTuple, Optional
 from PIL import Image, ImageGrab
 from PyQt6.QtWidgets import QRubberBand, QWidget, QApplication
-from PyQt6.QtCore import QRect, QPoint, Qt, pyqtSignal, QObject
-from PyQt6.QtGui import QPainter, QColor, QScreen, QGuiApplication
+from PyQt6.QtCore import (
+    QRect, QPoint, QSize, Qt, pyqtSignal, QObject, QRunnable, QThreadPool, QTimer
+)
+from PyQt6.QtGui import QPainter, QColor, QScreen, QGuiApplication, QImage
+
+try:
+    # fpng: PNG-кодировщик без перебора фильтров строк, на порядок быстрее libpng
+    import fpng_py
+except ImportError:
+    fpng_py = None
+
+# Камера DXcam (Desktop Duplication API), создается при первом захвате на Windows;
+# False - DXcam недоступен, используется захват через Qt
+_dxcam_camera = None
+
+def _grab_dxcam(x, y, width, height):
+    """Захват области основного монитора через DXcam
+    
+    Координаты задаются в физических пикселях относительно монитора.
+    
+    Returns:
+        Image.Image or None: None, если DXcam недоступен или кадр не получен
+    """
+    global _dxcam_camera
+    if _dxcam_camera is False:
+        return None
+    
+    if _dxcam_camera is None:
+        try:
+            import dxcam
+            _dxcam_camera = dxcam.create(output_color="RGB")
+        except Exception as e:
+            logging.info(f"DXcam недоступен, используется захват через Qt: {e}")
+            _dxcam_camera = False
+            return None
+    
+    try:
+        # grab возвращает None, если с прошлого захвата экран не менялся
+        frame = _dxcam_camera.grab(region=(x, y, x + width, y + height))
+    except Exception as e:
+        logging.warning(f"Ошибка захвата через DXcam: {e}")
+        return None
+    
+    if frame is None:
+        return None
+    return Image.fromarray(frame)
+
+# Захват через mss (XShm/XGetImage только нужной области), создается при первом
+# захвате под X11; False - mss недоступен, используется захват через Qt
+_mss_grabber = None
+
+def _grab_mss(left, top, width, height):
+    """Захват области экрана X11 через mss
+    
+    Координаты задаются в физических пикселях относительно корневого окна.
+    
+    Returns:
+        Image.Image or None: None, если mss недоступен или захват не удался
+    """
+    global _mss_grabber
+    if _mss_grabber is False:
+        return None
+    
+    if _mss_grabber is None:
+        try:
+            import mss
+            _mss_grabber = mss.mss()
+        except Exception as e:
+            logging.info(f"mss недоступен, используется захват через Qt: {e}")
+            _mss_grabber = False
+            return None
+    
+    try:
+        shot = _mss_grabber.grab({"left": left, "top": top, "width": width, "height": height})
+    except Exception as e:
+        logging.warning(f"Ошибка захвата через mss: {e}")
+        return None
+    
+    # Пиксели приходят в BGRA: Pillow переставляет каналы при распаковке
+    return Image.frombuffer("RGB", shot.size, shot.bgra, "raw", "BGRX", 0, 1)
+
+# Кодировщик libjpeg-turbo (PyTurboJPEG), создается при первом JPEG;
+# False - библиотека недоступна, используется кодировщик Pillow
+_turbo_jpeg = None
+
+def _get_turbo_jpeg():
+    """Получение кодировщика PyTurboJPEG или None, если он недоступен"""
+    global _turbo_jpeg
+    if _turbo_jpeg is None:
+        try:
+            from turbojpeg import TurboJPEG
+            _turbo_jpeg = TurboJPEG()
+        except Exception as e:
+            logging.info(f"PyTurboJPEG недоступен, JPEG кодируется через Pillow: {e}")
+            _turbo_jpeg = False
+    return _turbo_jpeg or None
+
+def _qimage_to_pil(image):
+    """Преобразование QImage в Image.Image без промежуточного кодирования"""
+    image = image.convertToFormat(QImage.Format.Format_RGB888)
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    return Image.frombuffer(
+        "RGB", (image.width(), image.height()), bytes(bits),
+        "raw", "RGB", image.bytesPerLine(), 1
+    )
+
+def _encode_png(image):
+    """Кодирование снимка в PNG с быстрым сжатием
+    
+    Скриншот сразу уходит в API, поэтому время кодирования важнее
+    размера: уровень Deflate 1 в разы быстрее уровня по умолчанию
+    при небольшом росте файла. Если установлен fpng_py, кодирует он.
+    """
+    channels = {"RGB": 3, "RGBA": 4}.get(image.mode)
+    if fpng_py is not None and channels:
+        try:
+            return fpng_py.fpng_encode_image_to_memory(
+                image.tobytes(), image.width, image.height, channels
+            )
+        except Exception as e:
+            logging.warning(f"Ошибка кодирования через fpng: {e}")
+    
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", optimize=False, compress_level=1)
+    return buffer.getvalue()
+
+def _quantize_png(png_data, pngquant):
+    """Перевод PNG в 8-битную палитру через pngquant
+    
+    Args:
+        png_data (bytes): Исходный PNG
+        pngquant (str): Путь к исполняемому файлу pngquant
+        
+    Returns:
+        bytes: Уменьшенный PNG или исходный, если pngquant не помог
+    """
+    try:
+        result = subprocess.run(
+            [pngquant, "--quality=65-90", "--speed=3", "--skip-if-larger", "-"],
+            input=png_data, capture_output=True, timeout=10
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logging.warning(f"Ошибка запуска pngquant: {e}")
+        return png_data
+    
+    # Код 98/99: результат больше исходного или ниже порога качества
+    if result.returncode != 0 or not result.stdout:
+        return png_data
+    return result.stdout
+
+def _encode_jpeg(image):
+    """Кодирование снимка в JPEG (качество 85, субдискретизация 4:2:0)
+    
+    Если доступен libjpeg-turbo через PyTurboJPEG, пиксели передаются ему
+    напрямую как массив, минуя JPEG-плагин Pillow.
+    """
+    turbo_jpeg = _get_turbo_jpeg()
+    if turbo_jpeg is not None:
+        import numpy as np
+        from turbojpeg import TJPF_RGB, TJSAMP_420
+        
+        try:
+            return turbo_jpeg.encode(
+                np.asarray(image), quality=85,
+                pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420
+            )
+        except Exception as e:
+            logging.warning(f"Ошибка кодирования через PyTurboJPEG: {e}")
+    
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85, subsampling=2)
+    return buffer.getvalue()
+
+def _encode_image(image, pngquant=None):
+    """Кодирование снимка для отправки в API
+    
+    Снимки интерфейса с небольшим числом цветов сжимаются в PNG без потерь
+    и компактно; остальное (фото, градиенты) - в JPEG, который в разы
+    меньше и кодируется быстрее, чем Deflate.
+    
+    Args:
+        image (Image.Image): Снимок
+        pngquant (str, optional): Путь к pngquant для сжатия PNG в палитру
+        
+    Returns:
+        tuple: (данные изображения, расширение файла - "png" или "jpg")
+    """
+    if image.getcolors(256) is not None:
+        png_data = _encode_png(image)
+        if pngquant:
+            png_data = _quantize_png(png_data, pngquant)
+        return png_data, "png"
+    
+    return _encode_jpeg(image), "jpg"
+
+class CapturedScreenshot(NamedTuple):
+    """Захваченный скриншот: PNG или JPEG в памяти и путь к его копии на диске"""
+    path: Optional[str]
+    data: bytes
+
+class _EncodeSignals(QObject):
+    """Передача закодированного скриншота из пула потоков в UI-поток"""
+    
+    # CapturedScreenshot или None при ошибке кодирования
+    done = pyqtSignal(object)
+
+class _EncodeTask(QRunnable):
+    """Кодирование скриншота и сохранение копии на диск в потоке QThreadPool"""
+    
+    def __init__(self, image, pngquant, path_prefix, signals):
+        super().__init__()
+        self.image = image
+        self.pngquant = pngquant
+        self.path_prefix = path_prefix
+        self.signals = signals
+    
+    def run(self):
+        image = self.image
+        self.image = None
+        
+        # Кодируем снимок один раз в память: эти байты уходят в API без повторного чтения файла
+        try:
+            if isinstance(image, QImage):
+                image = _qimage_to_pil(image)
+            image_data, extension = _encode_image(image, self.pngquant)
+        except Exception as e:
+            # Сигнал должен прийти в любом случае: по нему окно выходит из режима захвата
+            logging.error(f"Ошибка кодирования скриншота: {e}")
+            self.signals.done.emit(None)
+            return
+        
+        # Несжатый снимок больше не нужен: дальше храним только закодированный
+        del image
+        
+        # Сохраняем копию на диск для истории (если включено)
+        screenshot_path = None
+        if self.path_prefix is not None:
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            screenshot_path = self.path_prefix + timestamp + "." + extension
+            
+            try:
+                with open(screenshot_path, "wb") as f:
+                    f.write(image_data)
+                logging.info(f"Скриншот сохранен: {screenshot_path}")
+            except OSError as e:
+                logging.error(f"Ошибка сохранения скриншота: {e}")
+                screenshot_path = None
+        
+        # Скриншот в памяти и путь к файлу
+        self.signals.done.emit(CapturedScreenshot(screenshot_path, image_data))
 
 class ScreenshotSelection(QWidget):
-    """Виджет для выбора области экрана"""
+    """Виджет для выбора области экрана
+    
+    Создается один раз и переиспользуется: start() показывает его,
+    по завершении выбора виджет скрывается и испускает finished.
+    """
+    
+    # Выбор области завершен или отменен
+    finished = pyqtSignal()
+    
+    # Полупрозрачное затемнение экрана (RGBA: полупрозрачный черный)
+    _OVERLAY = QColor(0, 0, 0, 128)
+    
+    # Пауза между скрытием виджета и захватом: композитор должен успеть
+    # вывести кадр без затемнения, иначе оно попадет в скриншот
+    CAPTURE_DELAY_MS = 100
     
     def __init__(self):
         """Инициализация виджета выбора области экрана"""
@@ -38,25 +306,35 @@ class ScreenshotSelection(QWidget):
         self.setWindowState(Qt.WindowState.WindowFullScreen)
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
         self.setCursor(Qt.CursorShape.CrossCursor)
+    
+    def start(self):
+        """Сброс предыдущего выбора и показ виджета на весь экран"""
+        self.selection_active = False
+        self.origin = QPoint()
+        self.current = QPoint()
+        self.rubberband.hide()
+        self.rubberband.setGeometry(QRect())
         
-        # Показываем окно
         self.showFullScreen()
     
+    def _finish(self):
+        """Скрытие виджета и уведомление о завершении выбора"""
+        self.selection_active = False
+        self.rubberband.hide()
+        self.hide()
+        QTimer.singleShot(self.CAPTURE_DELAY_MS, self.finished.emit)
+    
     def paintEvent(self, event):
         """Отрисовка полупрозрачного наложения на экран"""
-        painter = QPainter(self)
-        painter.setPen(Qt.PenStyle.NoPen)
-        
-        # Полупрозрачное затемнение всего экрана
-        overlay_color = QColor(0, 0, 0, 128)  # RGBA: полупрозрачный черный
-        painter.setBrush(overlay_color)
-        painter.drawRect(0, 0, self.width(), self.height())
+        # Перерисовка идет на каждое движение мыши при выборе области
+        QPainter(self).fillRect(self.rect(), self._OVERLAY)
     
     def keyPressEvent(self, event):
         """Обработка нажатий клавиш"""
         if event.key() == Qt.Key.Key_Escape:
-            # Отмена выбора по Escape
-            self.close()
+            # Отмена выбора по Escape: пустая область означает отмену
+            self.rubberband.setGeometry(QRect())
+            self._finish()
     
     def mousePressEvent(self, event):
         """Обработка нажатия кнопки мыши"""
@@ -76,9 +354,7 @@ class ScreenshotSelection(QWidget):
         """Обработка отпускания кнопки мыши"""
         if event.button() == Qt.MouseButton.LeftButton and self.selection_active:
             self.current = event.pos()
-            self.selection_active = False
-            self.rubberband.hide()
-            self.close()
+            self._finish()
 
 class ScreenshotManager(QObject):
     """Менеджер для работы со скриншотами"""
@@ -86,87 +362,161 @@ class ScreenshotManager(QObject):
     # Сигнал о захвате скриншота
     screenshot_captured = pyqtSignal(object)
     
-    def __init__(self, screenshots_dir=None):
-        """Инициализация менеджера скриншотов"""
+    def __init__(self, screenshots_dir=None, save_to_disk=True, quantize=False):
+        """Инициализация менеджера скриншотов
+        
+        Args:
+            screenshots_dir (str or Path, optional): Папка для копий скриншотов
+            save_to_disk (bool): Сохранять ли копию скриншота для истории;
+                для отправки в API файл не нужен - снимок передается из памяти
+            quantize (bool): Сжимать ли PNG в 8-битную палитру через pngquant
+        """
         super().__init__()
         
+        self.save_to_disk = save_to_disk
+        
+        # pngquant - внешняя утилита, ищем ее один раз
+        self._pngquant = None
+        if quantize:
+            self._pngquant = shutil.which("pngquant")
+            if not self._pngquant:
+                logging.warning("pngquant не найден, скриншоты не будут квантоваться")
+        
         # Директория для сохранения скриншотов
         if screenshots_dir:
             self.screenshots_dir = Path(screenshots_dir)
-            self.screenshots_dir.mkdir(parents=True, exist_ok=True)
         else:
             self.screenshots_dir = Path(tempfile.gettempdir()) / "fastask_screenshots"
+        if self.save_to_disk:
             self.screenshots_dir.mkdir(parents=True, exist_ok=True)
         
-        # Текущее изображение
-        self.current_image = None
+        # Готовый префикс имени файла: путь к копии собирается конкатенацией строк
+        self._path_prefix = os.path.join(os.fspath(self.screenshots_dir), "screenshot_")
         
         # Виджет выбора области
         self.selection_widget = None
         
+        # Результат фонового кодирования приходит в UI-поток через этот объект
+        self._encode_signals = _EncodeSignals(self)
+        self._encode_signals.done.connect(self.screenshot_captured)
+        
+        # Основной экран кэшируется и обновляется при изменении набора экранов
+        self._screen = None
+        app = QGuiApplication.instance()
+        if app is not None:
+            self._screen = QGuiApplication.primaryScreen()
+            app.primaryScreenChanged.connect(self._refresh_screen)
+            app.screenAdded.connect(self._refresh_screen)
+            app.screenRemoved.connect(self._refresh_screen)
+        
         logging.info(f"Менеджер скриншотов инициализирован. Папка: {self.screenshots_dir}")
     
+    def _refresh_screen(self, *args):
+        """Обновление кэшированного основного экрана"""
+        self._screen = QGuiApplication.primaryScreen()
+    
     def capture(self):
         """Запуск процесса выбора области и захвата скриншота"""
-        # Создаем виджет выбора области
-        self.selection_widget = ScreenshotSelection()
+        # Виджет выбора области создаем при первом захвате и дальше только показываем
+        if self.selection_widget is None:
+            self.selection_widget = ScreenshotSelection()
+            self.selection_widget.finished.connect(self._on_selection_finished)
         
-        # Подключаем обработчик закрытия виджета
-        self.selection_widget.destroyed.connect(self._on_selection_closed)
+        self.selection_widget.start()
     
-    def _on_selection_closed(self):
-        """Обработка закрытия виджета выбора области"""
-        if not self.selection_widget:
-            return
-        
+    def _on_selection_finished(self):
+        """Обработка завершения выбора области"""
         # Получаем геометрию выбранной области
         selection_rect = self.selection_widget.rubberband.geometry()
+        x, y, width, height = selection_rect.getRect()
         
         # Если пользователь отменил выбор или ничего не выбрал
-        if selection_rect.width() <= 5 or selection_rect.height() <= 5:
+        if width < 6 or height < 6:
             logging.info("Выбор области скриншота отменен")
             self.screenshot_captured.emit(None)
             return
         
         # Получаем позицию области относительно экрана
-        global_pos = self.selection_widget.mapToGlobal(selection_rect.topLeft())
-        
-        # Делаем скриншот выбранной области
-        screen = QGuiApplication.primaryScreen()
-        screenshot = screen.grabWindow(
-            0,  # Захват всего экрана
-            global_pos.x(),
-            global_pos.y(),
-            selection_rect.width(),
-            selection_rect.height()
-        )
+        global_pos = self.selection_widget.mapToGlobal(QPoint(x, y))
         
-        # Сохраняем скриншот во временный файл
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        screenshot_path = self.screenshots_dir / f"screenshot_{timestamp}.png"
+        screen = self._screen or QGuiApplication.primaryScreen()
         
-        saved = screenshot.save(str(screenshot_path), "PNG")
-        if saved:
-            logging.info(f"Скриншот сохранен: {screenshot_path}")
-            # Эмитим сигнал с путем к файлу скриншота
-            self.screenshot_captured.emit(screenshot_path)
-        else:
-            logging.error("Ошибка сохранения скриншота")
-            self.screenshot_captured.emit(None)
+        # На Windows сначала пробуем Desktop Duplication: без копирования
+        # кадра через GDI, которое может подвисать поверх полноэкранных D3D-окон
+        image = None
+        if sys.platform == "win32":
+            image = self._grab_dxcam(screen, global_pos, selection_rect)
+        elif QGuiApplication.platformName() == "xcb":
+            # Под X11 grabWindow снимает весь корневой экран и обрезает его,
+            # mss запрашивает у X-сервера только выбранную область
+            ratio = screen.devicePixelRatio()
+            image = _grab_mss(
+                round(global_pos.x() * ratio),
+                round(global_pos.y() * ratio),
+                round(width * ratio),
+                round(height * ratio)
+            )
+        
+        if image is None:
+            # Делаем скриншот выбранной области
+            screenshot = screen.grabWindow(
+                0,  # Захват всего экрана
+                global_pos.x(),
+                global_pos.y(),
+                width,
+                height
+            )
+            image = screenshot.toImage()
+            del screenshot
+        
+        # Кодирование и запись на диск занимают десятки миллисекунд на больших
+        # областях, поэтому выполняются в пуле потоков, а не в UI-потоке
+        QThreadPool.globalInstance().start(_EncodeTask(
+            image,
+            self._pngquant,
+            self._path_prefix if self.save_to_disk else None,
+            self._encode_signals
+        ))
+    
+    @staticmethod
+    def _grab_dxcam(screen, global_pos, selection_rect):
+        """Захват области через DXcam
+        
+        Returns:
+            Image.Image or None: Снимок или None, если нужно захватить через Qt
+        """
+        # DXcam работает в физических пикселях относительно основного монитора
+        ratio = screen.devicePixelRatio()
+        origin = screen.geometry().topLeft()
+        x = round((global_pos.x() - origin.x()) * ratio)
+        y = round((global_pos.y() - origin.y()) * ratio)
+        width = round(selection_rect.width() * ratio)
+        height = round(selection_rect.height() * ratio)
+        
+        # Область за пределами основного монитора DXcam не захватит
+        size = screen.size()
+        if x < 0 or y < 0 or x + width > round(size.width() * ratio) or y + height > round(size.height() * ratio):
+            return None
+        
+        return _grab_dxcam(x, y, width, height)
     
     @staticmethod
-    def get_base64_image(image_path):
-        """Преобразование изображения в base64 для отправки в API
+    def get_raw_bytes(image_path):
+        """Получение содержимого файла изображения без копирования в память процесса
+        
+        Файл отображается в память (mmap): данные читаются прямо из кэша
+        страниц ОС по мере обращения к ним.
         
         Args:
             image_path (str or Path): Путь к файлу изображения
             
         Returns:
-            str: Строка в формате base64
+            mmap.mmap or None: Содержимое файла (поддерживает буферный протокол)
         """
         try:
             with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
-        except Exception as e:
-            logging.error(f"Ошибка при кодировании изображения в base64: {str(e)}")
-            return None 
\ No newline at end of file
+                return mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            # ValueError - пустой файл, его нельзя отобразить в память
+            logging.error(f"Ошибка чтения изображения: {str(e)}")
+            return None